@@ -0,0 +1,202 @@
+"""Times the phases of an organize run on synthetic corpora and saves the results as JSON.
+
+    python benchmark.py --counts 1000 10000 100000 -o results.json
+    python benchmark.py --counts 10000 --compare results.json
+
+Each corpus comes from generate_corpus in "creating file.py".  The scan,
+classify, plan, move and undo phases are timed separately; since undo puts
+every file back, repeats run on the same corpus.  With --compare, phases
+that got slower than --threshold times the baseline are reported and the
+exit code is 1; a baseline run with other settings (anything but --counts)
+is refused with exit code 2.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import importlib.util
+
+from organizer import HistoryJournal, SORTED_FOLDER_NAME, undo_history
+from organizer.engine import classify_files, plan_moves, run_plan
+from organizer.scan import SortedIndex, walk_files
+from organizer.sniff import ContentSniffer
+
+PHASES = ("scan", "classify", "plan", "move", "undo")
+
+
+def load_corpus_module():
+    """Imports "creating file.py", whose name is not a valid module name."""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "creating file.py")
+    spec = importlib.util.spec_from_file_location("creating_file", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def time_run(directory, history, recursive, sniff, workers, batch=False):
+    """Runs one organize + undo cycle and returns the seconds spent per phase."""
+    timings = {}
+    sorted_folder = os.path.join(directory, SORTED_FOLDER_NAME)
+    max_depth = None if recursive else 0
+
+    start = time.perf_counter()
+    files = list(walk_files(directory, max_depth, skip_dirs=[sorted_folder]))
+    timings["scan"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    sniffer = ContentSniffer(sniff) if sniff else None
+    classified = list(classify_files(directory, files, sniffer))
+    timings["classify"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    os.makedirs(sorted_folder, exist_ok=True)
+    entries = list(plan_moves(directory, classified, SortedIndex(sorted_folder),
+                              skip_sorted_names=not recursive))
+    timings["plan"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    summary = run_plan(entries, len(entries), history, workers=workers, directory=directory,
+                       batch=batch)
+    timings["move"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    undo_history(history, workers=workers)
+    timings["undo"] = time.perf_counter() - start
+    return timings, len(files), summary.moved
+
+
+def benchmark(count, args, corpus):
+    """Generates one corpus and times args.repeat cycles on it."""
+    root = tempfile.mkdtemp(prefix="organizer-bench-", dir=args.workdir)
+    try:
+        directory = os.path.join(root, "corpus")
+        stats = corpus.generate_corpus(directory, count, args.depth, args.fanout,
+                                       args.collision_rate, args.unknown_share, args.sizes,
+                                       args.max_size, args.seed)
+        history = HistoryJournal(os.path.join(root, "history"))
+        runs = []
+        for _ in range(args.repeat):
+            timings, scanned, moved = time_run(directory, history, args.depth > 0,
+                                               args.sniff, args.workers, args.batch)
+            runs.append(timings)
+
+        phases = {}
+        for phase in PHASES:
+            samples = [timings[phase] for timings in runs]
+            best = min(samples)
+            phases[phase] = {"best": best, "median": statistics.median(samples),
+                             "files_per_sec": scanned / best if best else None}
+        return {"files": count, "scanned": scanned, "moved": moved, "bytes": stats["bytes"],
+                "folders": stats["folders"], "collisions": stats["collisions"], "phases": phases}
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def setting_differences(results, baseline):
+    """Returns "name: old -> new" for each corpus or run setting that differs from the baseline.
+
+    The corpus sizes are left out, since results are matched by them.
+    """
+    old = baseline.get("settings", {})
+    new = results["settings"]
+    return [f"{key}: {old.get(key)} -> {new.get(key)}"
+            for key in sorted(set(old) | set(new))
+            if key != "counts" and old.get(key) != new.get(key)]
+
+
+def compare(results, baseline, threshold):
+    """Prints phases slower than threshold times the baseline; returns how many there were."""
+    previous = {result["files"]: result for result in baseline["results"]}
+    regressions = 0
+    for result in results["results"]:
+        before = previous.get(result["files"])
+        if before is None:
+            continue
+        for phase in PHASES:
+            old = before["phases"].get(phase, {}).get("best")
+            new = result["phases"][phase]["best"]
+            if not old:
+                continue
+            ratio = new / old
+            marker = ""
+            if ratio > threshold:
+                marker = "  <-- regression"
+                regressions += 1
+            print(f"{result['files']:>8} files  {phase:<8}  {old:8.3f}s -> {new:8.3f}s  "
+                  f"({ratio:.2f}x){marker}")
+    return regressions
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the organizer on synthetic files.")
+    parser.add_argument("--counts", type=int, nargs="+", default=[1000, 10000],
+                        help="corpus sizes to run (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="organize + undo cycles per corpus (default: %(default)s)")
+    parser.add_argument("--depth", type=int, default=0,
+                        help="nested folder levels; above 0 the run is recursive")
+    parser.add_argument("--fanout", type=int, default=4)
+    parser.add_argument("--collision-rate", type=float, default=0.05)
+    parser.add_argument("--unknown-share", type=float, default=0.05)
+    parser.add_argument("--sizes", choices=["tiny", "uniform", "lognormal"], default="tiny")
+    parser.add_argument("--max-size", type=int, default=1024 * 1024)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--sniff", choices=["unknown", "all"], default=None)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--batch", action="store_true",
+                        help="move with the batched executor (see execute_batched)")
+    parser.add_argument("--workdir", default=None,
+                        help="folder to create corpora in (default: the system temp folder)")
+    parser.add_argument("-o", "--output", default="benchmark_results.json",
+                        help="where to write the results (default: %(default)s)")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="results file from an earlier version to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="slowdown ratio reported as a regression (default: %(default)s)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    corpus = load_corpus_module()
+    settings = {key: value for key, value in vars(args).items()
+                if key not in ("output", "compare", "threshold", "workdir")}
+    results = {"created": time.time(), "python": platform.python_version(),
+               "platform": platform.platform(), "settings": settings, "results": []}
+
+    for count in args.counts:
+        print(f"Benchmarking {count} files...")
+        result = benchmark(count, args, corpus)
+        results["results"].append(result)
+        for phase in PHASES:
+            timing = result["phases"][phase]
+            print(f"  {phase:<8} {timing['best']:8.3f}s  ({timing['files_per_sec'] or 0:,.0f} files/s)")
+
+    tmp_path = args.output + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    os.replace(tmp_path, args.output)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        differences = setting_differences(results, baseline)
+        if differences:
+            print(f"Not comparing with {args.compare}, it was run with other settings:",
+                  file=sys.stderr)
+            for difference in differences:
+                print(f"  {difference}", file=sys.stderr)
+            return 2
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,20 @@
 import os
+import random
+import argparse
+from array import array
+
+# File categories and their extensions, shared with the organizer
+from organizer.categories import FILE_CATEGORIES
+
+# Extensions no category claims; "" gives files without an extension
+UNKNOWN_EXTENSIONS = ["", ".dat", ".bin2", ".xyz", ".tmp1", ".cache"]
+
+# File size distributions for generated files
+SIZE_DISTRIBUTIONS = ("tiny", "uniform", "lognormal")
+
+# Random bytes that file contents are sliced from
+_BLOCK_SIZE = 1024 * 1024
 
-# Define file categories and their extensions
-FILE_CATEGORIES = {
-    "Images": [".jpg", ".jpeg", ".png", ".gif", ".bmp", ".svg", ".webp"],
-    "Videos": [".mp4", ".mkv", ".flv", ".avi", ".mov", ".wmv"],
-    "Documents": [".pdf", ".docx", ".doc", ".txt", ".xlsx", ".pptx", ".csv"],
-    "Music": [".mp3", ".wav", ".aac", ".flac", ".ogg"],
-    "Archives": [".zip", ".rar", ".7z", ".tar", ".gz"],
-    "Executables": [".exe", ".msi", ".sh", ".bat"],
-    "Code": [".py", ".js", ".html", ".css", ".cpp", ".java", ".c", ".php"]
-}
 
 def create_test_files(directory):
     if not os.path.exists(directory):
@@ -28,8 +33,153 @@ def create_test_files(directory):
 
     print("\nTest files have been created successfully!")
 
-# Get user input
-if __name__ == "__main__":
-    target_directory = input("Enter the directory where you want to create test files: ").strip()
-    create_test_files(target_directory)
 
+def make_folders(directory, depth, fanout):
+    """Creates a tree fanout folders wide and depth levels deep; returns every folder in it."""
+    folders = [directory]
+    level = [directory]
+    for d in range(depth):
+        next_level = []
+        for parent in level:
+            for i in range(fanout):
+                folder = os.path.join(parent, f"dir_{d}_{i}")
+                os.makedirs(folder, exist_ok=True)
+                next_level.append(folder)
+        folders.extend(next_level)
+        level = next_level
+    return folders
+
+
+def pick_size(rng, distribution, max_size):
+    """Returns a file size in bytes drawn from the named distribution."""
+    if distribution == "tiny":
+        return 0
+    if distribution == "uniform":
+        return rng.randint(0, max_size)
+    # Most files small, a long tail of big ones (median around 16 KiB)
+    return min(int(rng.lognormvariate(9.7, 2.0)), max_size)
+
+
+def generate_corpus(directory, count=1000, depth=0, fanout=4, collision_rate=0.0,
+                    unknown_share=0.0, sizes="tiny", max_size=16 * 1024 * 1024,
+                    seed=None, verbose=False):
+    """Fills directory with count synthetic files for load testing.
+
+    Files are spread over a folder tree depth levels deep, and an
+    unknown_share of them gets an extension no category claims (or none).
+    A collision_rate share of the files takes the name of an earlier file
+    in another folder, so a recursive run has to rename one of the two.
+    Without subfolders (depth 0) the name is placed in the matching
+    Sorted/<Category>/ folder instead; that is a conflict for recursive
+    runs and watch mode, while a one-off run of a single folder skips the
+    file as already sorted.  Every file starts with its own path, so no
+    two files are identical.  Returns a dict with the number of files and
+    bytes written.
+    """
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    folders = make_folders(directory, depth, fanout)
+    known = [(category, ext) for category, extensions in FILE_CATEGORIES.items()
+             for ext in extensions]
+    block = os.urandom(_BLOCK_SIZE)
+    max_size = max(0, max_size)
+    total_bytes = 0
+    collisions = 0
+    # Number, extension and folder of every name not reused so far, and
+    # the (number, folder) pairs a name was reused in
+    seen_extensions = []
+    extension_codes = {}
+    name_numbers = array("I")
+    name_extensions = array("I")
+    name_folders = array("I")
+    reused = set()
+
+    def write_file(path, size):
+        with open(path, "wb") as f:
+            header = os.path.relpath(path, directory).encode() + b"\n"
+            f.write(header)
+            remaining = size - len(header)
+            while remaining > 0:
+                chunk = min(remaining, _BLOCK_SIZE)
+                f.write(block[:chunk])
+                remaining -= chunk
+        return max(size, len(header))
+
+    for i in range(count):
+        if rng.random() < unknown_share:
+            category, ext = None, rng.choice(UNKNOWN_EXTENSIONS)
+        else:
+            category, ext = rng.choice(known)
+        file_name = f"file_{i}{ext}"
+        position = rng.randrange(len(folders))
+        collide = rng.random() < collision_rate
+        reuse = None
+        if collide and depth > 0 and name_numbers:
+            # Reuse an earlier name; its extension, and so its category, comes along
+            pick = rng.randrange(len(name_numbers))
+            number = name_numbers[pick]
+            if position != name_folders[pick] and (number, position) not in reused:
+                reuse = (number, position)
+                file_name = f"file_{number}{seen_extensions[name_extensions[pick]]}"
+        size = pick_size(rng, sizes, max_size)
+        total_bytes += write_file(os.path.join(folders[position], file_name), size)
+        if reuse is not None:
+            reused.add(reuse)
+            collisions += 1
+        else:
+            code = extension_codes.get(ext)
+            if code is None:
+                code = extension_codes[ext] = len(seen_extensions)
+                seen_extensions.append(ext)
+            name_numbers.append(i)
+            name_extensions.append(code)
+            name_folders.append(position)
+
+        if collide and depth == 0 and category is not None:
+            sorted_folder = os.path.join(directory, "Sorted", category)
+            os.makedirs(sorted_folder, exist_ok=True)
+            write_file(os.path.join(sorted_folder, file_name), 0)
+            collisions += 1
+
+        if verbose and (i + 1) % 10000 == 0:
+            print(f"Created {i + 1} of {count} files")
+
+    return {"files": count, "bytes": total_bytes, "collisions": collisions,
+            "folders": len(folders)}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Create synthetic files to test the organizer with.")
+    parser.add_argument("directory", help="where to create the files")
+    parser.add_argument("--sample", action="store_true",
+                        help="create one small file per known extension and nothing else")
+    parser.add_argument("-n", "--count", type=int, default=1000,
+                        help="number of files, e.g. 1000 to 1000000 (default: %(default)s)")
+    parser.add_argument("--depth", type=int, default=0,
+                        help="levels of nested folders (default: %(default)s)")
+    parser.add_argument("--fanout", type=int, default=4,
+                        help="subfolders per folder when --depth is used (default: %(default)s)")
+    parser.add_argument("--collision-rate", type=float, default=0.0,
+                        help="share of files named like an earlier file in another folder, "
+                             "or like a file in Sorted/ without --depth (default: %(default)s)")
+    parser.add_argument("--unknown-share", type=float, default=0.0,
+                        help="share of files with unknown or no extension (default: %(default)s)")
+    parser.add_argument("--sizes", choices=SIZE_DISTRIBUTIONS, default="tiny",
+                        help="file size distribution (default: %(default)s)")
+    parser.add_argument("--max-size", type=int, default=16 * 1024 * 1024,
+                        help="largest file size in bytes (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="random seed, for a reproducible corpus")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    if args.sample:
+        create_test_files(args.directory)
+    else:
+        stats = generate_corpus(args.directory, args.count, args.depth, args.fanout,
+                                args.collision_rate, args.unknown_share, args.sizes,
+                                args.max_size, args.seed, verbose=True)
+        print(f"Created {stats['files']} files ({stats['bytes']} bytes) in {stats['folders']} folders, "
+              f"{stats['collisions']} with a name used by another file")
@@ -1,31 +1,24 @@
 import os
-import shutil
-import json
 import logging
 import sys
+import threading
+import time
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                              QLabel, QLineEdit, QPushButton, QFileDialog,
                              QMessageBox, QCheckBox, QGroupBox, QHBoxLayout,
-                             QProgressBar, QStyle)
-from PyQt5.QtCore import Qt, QSize, QEvent
+                             QProgressBar, QStyle, QInputDialog, QDialog, QTableView,
+                             QComboBox, QHeaderView, QAbstractItemView)
+from PyQt5.QtCore import (Qt, QSize, QEvent, QObject, QThread, QTimer, pyqtSignal,
+                          QAbstractTableModel, QModelIndex)
 from PyQt5.QtGui import QFont, QIcon, QPalette, QColor
 
-# Configure logging
-logging.basicConfig(filename="file_sorting.log", level=logging.INFO, format="%(asctime)s - %(message)s")
+from organizer import (ContentSniffer, Deduplicator, HistoryJournal, OrganizeError, PlanPreview,
+                       build_plan, find_interrupted_runs, load_rules, open_state,
+                       organize_directory, queue_logging, resume_run, rollback_run, undo_history)
+from organizer.preview import COLUMNS, STATUSES, format_size
 
-# File type categories
-FILE_CATEGORIES = {
-    "Images": [".jpg", ".jpeg", ".png", ".gif", ".bmp", ".svg", ".webp"],
-    "Videos": [".mp4", ".mkv", ".flv", ".avi", ".mov", ".wmv"],
-    "Documents": [".pdf", ".docx", ".doc", ".txt", ".xlsx", ".pptx", ".csv"],
-    "Music": [".mp3", ".wav", ".aac", ".flac", ".ogg"],
-    "Archives": [".zip", ".rar", ".7z", ".tar", ".gz"],
-    "Executables": [".exe", ".msi", ".sh", ".bat"],
-    "Code": [".py", ".js", ".html", ".css", ".cpp", ".java", ".c", ".php"]
-}
-
-# File to store sorting history for undo
-HISTORY_FILE = os.path.join(os.path.expanduser("~"), "file_organizer_history.json")
+# Configure logging; records are written to the file on a background thread
+queue_logging("file_sorting.log")
 
 
 def resource_path(relative_path):
@@ -59,6 +52,206 @@ class DraggableLineEdit(QLineEdit):
                     self.setText(os.path.dirname(path))
 
 
+class EngineWorker(QObject):
+    """Runs an engine call on a background thread and reports back via signals.
+
+    task is called as task(progress, cancel) and returns a summary tuple.
+    Progress signals are throttled to at most max_rate per second; -1 means
+    the total is not known yet (e.g. while walking subfolders).
+    """
+    progress = pyqtSignal(int)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, task, max_rate=30):
+        super().__init__()
+        self.task = task
+        self.min_interval = 1.0 / max_rate
+        self.cancel_event = threading.Event()
+        self._last_emit = 0.0
+
+    def report(self, done, total):
+        """Progress callback handed to the engine; runs on the worker thread."""
+        now = time.monotonic()
+        if not total:
+            if now - self._last_emit >= self.min_interval:
+                self._last_emit = now
+                self.progress.emit(-1)
+            return
+        if now - self._last_emit >= self.min_interval or done >= total:
+            self._last_emit = now
+            self.progress.emit(int((done / total) * 100))
+
+    def run(self):
+        try:
+            summary = self.task(self.report, self.cancel_event)
+        except OrganizeError as e:
+            self.failed.emit(str(e))
+        except Exception as e:
+            logging.error(f"Background task failed: {str(e)}")
+            self.failed.emit(str(e))
+        else:
+            self.finished.emit(summary)
+
+    def cancel(self):
+        self.cancel_event.set()
+
+
+class PlanTableModel(QAbstractTableModel):
+    """Table model over a PlanPreview that hands rows to the view in chunks.
+
+    The preview is fully loaded before the model is made.  The view only
+    learns about fetch_size rows at a time (canFetchMore / fetchMore), and
+    cells are formatted when they are painted, so showing or re-sorting a
+    loaded plan of 500k files costs about as much as 2k.
+    """
+    HEADERS = ("File", "Category", "Size", "Status", "Destination")
+
+    def __init__(self, preview, fetch_size=2000, parent=None):
+        super().__init__(parent)
+        self.preview = preview
+        self.fetch_size = fetch_size
+        self.loaded = min(fetch_size, len(preview.rows))
+        self.sort_by = None
+        self.descending = False
+        self.filters = {}
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.loaded
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.loaded < len(self.preview.rows)
+
+    def fetchMore(self, parent=QModelIndex()):
+        count = min(self.fetch_size, len(self.preview.rows) - self.loaded)
+        if count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self.loaded, self.loaded + count - 1)
+        self.loaded += count
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        column = index.column()
+        if role == Qt.TextAlignmentRole:
+            return int(Qt.AlignRight | Qt.AlignVCenter) if column == 2 else None
+        if role == Qt.ToolTipRole:
+            return self.preview.source(self.preview.rows[index.row()])
+        if role != Qt.DisplayRole:
+            return None
+        value = self.preview.row(index.row())[column]
+        if column == 2:
+            return format_size(value)
+        return value or ""
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sort_by = COLUMNS[column] if 0 <= column < len(COLUMNS) else None
+        self.descending = order == Qt.DescendingOrder
+        self.refresh()
+
+    def set_filters(self, **filters):
+        """Shows only the rows matching filters (see PlanPreview.select)."""
+        self.filters = filters
+        self.refresh()
+
+    def refresh(self):
+        self.beginResetModel()
+        self.preview.select(self.sort_by, self.descending, **self.filters)
+        self.loaded = min(self.fetch_size, len(self.preview.rows))
+        self.endResetModel()
+
+
+class PlanPreviewDialog(QDialog):
+    """Shows what an organize run would do, with sorting and filters."""
+    # (label, min_size, max_size) choices of the size filter
+    SIZE_FILTERS = (("Any size", None, None),
+                    ("Under 1 MB", None, 1024 ** 2),
+                    ("1 MB to 100 MB", 1024 ** 2, 100 * 1024 ** 2),
+                    ("100 MB to 1 GB", 100 * 1024 ** 2, 1024 ** 3),
+                    ("Over 1 GB", 1024 ** 3, None))
+
+    def __init__(self, preview, directory, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(f"Preview — {directory}")
+        self.resize(900, 600)
+        self.preview = preview
+        self.model = PlanTableModel(preview, parent=self)
+
+        self.category_filter = QComboBox()
+        self.category_filter.addItem("All categories", None)
+        for category in preview.categories():
+            self.category_filter.addItem(category, category)
+        self.status_filter = QComboBox()
+        self.status_filter.addItem("Any status", None)
+        for status in STATUSES:
+            if preview.counts[status]:
+                self.status_filter.addItem(f"{status} ({preview.counts[status]})", status)
+        self.size_filter = QComboBox()
+        for label, _, _ in self.SIZE_FILTERS:
+            self.size_filter.addItem(label)
+        for combo in (self.category_filter, self.status_filter, self.size_filter):
+            combo.currentIndexChanged.connect(self.apply_filters)
+
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(self.category_filter)
+        filter_layout.addWidget(self.status_filter)
+        filter_layout.addWidget(self.size_filter)
+        filter_layout.addStretch(1)
+
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setWordWrap(False)
+        self.table.verticalHeader().hide()
+        # Fixed row heights, so the view never measures rows it does not show
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table.verticalHeader().setDefaultSectionSize(22)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.table.setSortingEnabled(True)
+        self.table.setColumnWidth(0, 220)
+        self.table.setColumnWidth(1, 130)
+        self.table.setColumnWidth(2, 80)
+        self.table.setColumnWidth(3, 80)
+
+        self.count_label = QLabel()
+        close_button = QPushButton("Close")
+        close_button.clicked.connect(self.accept)
+        bottom_layout = QHBoxLayout()
+        bottom_layout.addWidget(self.count_label)
+        bottom_layout.addStretch(1)
+        bottom_layout.addWidget(close_button)
+
+        layout = QVBoxLayout()
+        layout.addLayout(filter_layout)
+        layout.addWidget(self.table)
+        layout.addLayout(bottom_layout)
+        self.setLayout(layout)
+        self.update_count()
+
+    def apply_filters(self):
+        _, min_size, max_size = self.SIZE_FILTERS[self.size_filter.currentIndex()]
+        self.model.set_filters(category=self.category_filter.currentData(),
+                               status=self.status_filter.currentData(),
+                               min_size=min_size, max_size=max_size)
+        self.update_count()
+
+    def update_count(self):
+        text = f"Showing {len(self.preview.rows)} of {len(self.preview)} files"
+        if self.preview.cancelled:
+            text += " (preview stopped early)"
+        self.count_label.setText(text)
+
+
 class FileOrganizerApp(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -72,9 +265,16 @@ class FileOrganizerApp(QMainWindow):
         else:
             self.setWindowIcon(self.style().standardIcon(QStyle.SP_DirIcon))
 
+        self.history = HistoryJournal()
+        self.worker = None
+        self.worker_thread = None
+
         self.set_dark_theme()
         self.initUI()
 
+        # Look for a run that did not finish once the window is up
+        QTimer.singleShot(0, self.check_interrupted_runs)
+
     def set_dark_theme(self):
         """Sets a dark grey/black theme for the application."""
         palette = QPalette()
@@ -207,7 +407,32 @@ class FileOrganizerApp(QMainWindow):
         self.keep_sorted_checkbox.setChecked(True)
         self.keep_sorted_checkbox.setToolTip("When checked, keeps previously sorted files in their folders")
 
+        self.recursive_checkbox = QCheckBox("Include subfolders")
+        self.recursive_checkbox.setChecked(False)
+        self.recursive_checkbox.setToolTip("When checked, also sorts files found in subfolders")
+
+        self.sniff_checkbox = QCheckBox("Detect file types from content")
+        self.sniff_checkbox.setChecked(False)
+        self.sniff_checkbox.setToolTip("When checked, files with unknown or missing extensions are identified by their first bytes")
+
         options_layout.addWidget(self.keep_sorted_checkbox)
+        options_layout.addWidget(self.recursive_checkbox)
+        self.dedup_checkbox = QCheckBox("Leave exact duplicates in place")
+        self.dedup_checkbox.setChecked(False)
+        self.dedup_checkbox.setToolTip("When checked, files identical to one already sorted are skipped instead of renamed")
+
+        self.incremental_checkbox = QCheckBox("Only process new or changed files")
+        self.incremental_checkbox.setChecked(False)
+        self.incremental_checkbox.setToolTip("When checked, folders and files left unchanged since the last run are not scanned again")
+
+        self.verify_checkbox = QCheckBox("Verify copies to other drives")
+        self.verify_checkbox.setChecked(False)
+        self.verify_checkbox.setToolTip("When checked, files copied to another drive are compared with the original before it is deleted")
+
+        options_layout.addWidget(self.sniff_checkbox)
+        options_layout.addWidget(self.dedup_checkbox)
+        options_layout.addWidget(self.incremental_checkbox)
+        options_layout.addWidget(self.verify_checkbox)
         options_group.setLayout(options_layout)
 
         # Progress bar
@@ -225,13 +450,26 @@ class FileOrganizerApp(QMainWindow):
         self.sort_button.clicked.connect(self.start_sorting)
         self.sort_button.setToolTip("Organize files into categorized folders")
 
+        self.preview_button = QPushButton("Preview")
+        self.preview_button.setIcon(self.style().standardIcon(QStyle.SP_FileDialogDetailedView))
+        self.preview_button.clicked.connect(self.start_preview)
+        self.preview_button.setToolTip("List where every file would go, without moving anything")
+
         self.undo_button = QPushButton("Undo Last Action")
         self.undo_button.setIcon(self.style().standardIcon(QStyle.SP_ArrowBack))
         self.undo_button.clicked.connect(self.start_undo)
         self.undo_button.setToolTip("Revert the last organization action")
 
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.setIcon(self.style().standardIcon(QStyle.SP_DialogCancelButton))
+        self.cancel_button.clicked.connect(self.cancel_task)
+        self.cancel_button.setToolTip("Stop after the file currently being moved")
+        self.cancel_button.hide()
+
         button_layout.addWidget(self.sort_button)
+        button_layout.addWidget(self.preview_button)
         button_layout.addWidget(self.undo_button)
+        button_layout.addWidget(self.cancel_button)
 
         # Add widgets to main layout
         layout.addWidget(header)
@@ -251,250 +489,239 @@ class FileOrganizerApp(QMainWindow):
     def start_sorting(self):
         target_directory = self.dir_input.text().strip()
         if target_directory:
-            self.progress_bar.show()
             keep_existing = self.keep_sorted_checkbox.isChecked()
-            self.organize_directory(target_directory, keep_existing)
-            self.progress_bar.hide()
+            recursive = self.recursive_checkbox.isChecked()
+            sniff = self.sniff_checkbox.isChecked()
+            dedup = self.dedup_checkbox.isChecked()
+            incremental = self.incremental_checkbox.isChecked()
+            verify = self.verify_checkbox.isChecked()
+            if not keep_existing:
+                reply = QMessageBox.question(self, 'Confirm Reset',
+                                             "Existing category folders inside Sorted/ will be deleted before sorting.\nDo you want to continue?",
+                                             QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+                if reply != QMessageBox.Yes:
+                    return
+            self.organize_directory(target_directory, keep_existing, recursive, sniff, dedup,
+                                    incremental, verify)
         else:
             QMessageBox.warning(self, "Warning", "Please select a folder first.")
 
-    def start_undo(self):
-        self.progress_bar.show()
-        self.undo_sorting()
-        self.progress_bar.hide()
-
-    def log_move(self, file, category):
-        """Logs moved files."""
-        logging.info(f"Moved: {file} → {category}/")
-
-    def get_unique_filename(self, folder, filename):
-        """Prevents overwriting by renaming duplicate files."""
-        base, ext = os.path.splitext(filename)
-        counter = 1
-        new_filename = filename
-
-        while os.path.exists(os.path.join(folder, new_filename)):
-            new_filename = f"{base}_{counter}{ext}"
-            counter += 1
-
-        return new_filename
-
-    def save_sorting_history(self, original_path, new_path):
-        """Saves original file locations to a history file for undo."""
-        history = {}
-
-        if os.path.exists(HISTORY_FILE):
-            try:
-                with open(HISTORY_FILE, "r") as f:
-                    history = json.load(f)
-            except json.JSONDecodeError:
-                history = {}
+    def start_preview(self):
+        """Plans a run with the current options and shows it without moving anything."""
+        directory = self.dir_input.text().strip()
+        if not directory:
+            QMessageBox.warning(self, "Warning", "Please select a folder first.")
+            return
+        keep_existing = self.keep_sorted_checkbox.isChecked()
+        recursive = self.recursive_checkbox.isChecked()
+        sniffer = ContentSniffer() if self.sniff_checkbox.isChecked() else None
+        deduplicator = Deduplicator("skip") if self.dedup_checkbox.isChecked() else None
 
-        history[new_path] = original_path  # Store new_path -> original_path mapping
+        def task(progress, cancel):
+            entries, total = build_plan(directory, keep_existing, recursive, sniffer=sniffer,
+                                        deduplicator=deduplicator, rules=load_rules())
+            return PlanPreview().load(entries or [], total, progress, cancel)
 
-        with open(HISTORY_FILE, "w") as f:
-            json.dump(history, f, indent=4)
+        self.run_in_background(task, lambda preview: self.show_preview(preview, directory))
 
-    def organize_directory(self, directory, keep_existing=True):
-        """Sorts files into categorized folders inside a 'Sorted' directory."""
-        if not os.path.exists(directory):
-            QMessageBox.critical(self, "Error", "The selected folder does not exist.")
+    def show_preview(self, preview, directory):
+        if not len(preview):
+            QMessageBox.information(self, "Info", "No files found to organize in the selected folder.")
             return
+        PlanPreviewDialog(preview, directory, self).exec_()
 
-        directory = os.path.abspath(directory)
-        sorted_folder = os.path.join(directory, "Sorted")
-
-        # Get all files to process
+    def check_interrupted_runs(self):
+        """Offers to resume or roll back a run that did not finish last time."""
         try:
-            files_to_process = [f for f in os.listdir(directory)
-                                if os.path.isfile(os.path.join(directory, f)) and
-                                not f.startswith('.')]  # Skip hidden files
-        except PermissionError:
-            QMessageBox.critical(self, "Error", f"Permission denied when accessing {directory}")
+            runs = find_interrupted_runs(self.history)
+        except OSError as e:
+            logging.error(f"Failed to read history file: {str(e)}")
             return
-
-        if not files_to_process:
-            QMessageBox.information(self, "Info", "No files found to organize in the selected folder.")
+        if not runs:
             return
+        run = runs[0]
+
+        msg = QMessageBox(self)
+        msg.setWindowTitle("Interrupted Run")
+        msg.setIcon(QMessageBox.Warning)
+        msg.setText(f"Organizing {run.directory} did not finish last time.\n"
+                    f"{len(run.committed) + len(run.pending)} files were moved or being moved when it stopped.\n\n"
+                    "Resume the run, or move those files back?")
+        resume_button = msg.addButton("Resume", QMessageBox.AcceptRole)
+        rollback_button = msg.addButton("Roll Back", QMessageBox.DestructiveRole)
+        msg.addButton("Later", QMessageBox.RejectRole)
+        msg.exec_()
+
+        if msg.clickedButton() is resume_button:
+            def task(progress, cancel):
+                return resume_run(run, self.history, progress, cancel)
+            self.run_in_background(task, self.show_organize_summary)
+        elif msg.clickedButton() is rollback_button:
+            def task(progress, cancel):
+                return rollback_run(run, self.history, progress, cancel)
+            self.run_in_background(task, self.show_undo_summary)
 
-        # Create Sorted folder if it doesn't exist
-        if not os.path.exists(sorted_folder):
-            try:
-                os.makedirs(sorted_folder)
-            except PermissionError:
-                QMessageBox.critical(self, "Error", f"Permission denied when creating {sorted_folder}")
-                return
-
-        # If not keeping existing, clean up previous sorted folders
-        if not keep_existing:
-            for category in FILE_CATEGORIES.keys():
-                category_folder = os.path.join(sorted_folder, category)
-                if os.path.exists(category_folder):
-                    try:
-                        shutil.rmtree(category_folder)
-                    except PermissionError:
-                        logging.error(f"Permission denied when removing {category_folder}")
-                        continue
-            others_folder = os.path.join(sorted_folder, "Others")
-            if os.path.exists(others_folder):
-                try:
-                    shutil.rmtree(others_folder)
-                except PermissionError:
-                    logging.error(f"Permission denied when removing {others_folder}")
-
-        total_files = len(files_to_process)
-        processed_files = 0
-        moved_files = 0
-        skipped_files = 0
-
-        for filename in files_to_process:
-            file_path = os.path.join(directory, filename)
-            self.progress_bar.setValue(int((processed_files / total_files) * 100))
-            QApplication.processEvents()  # Keep UI responsive
-
-            file_extension = os.path.splitext(filename)[1].lower()
-            category = "Others"  # Default category
-
-            for cat, extensions in FILE_CATEGORIES.items():
-                if file_extension in extensions:
-                    category = cat
-                    break
-
-            # Create category folder inside "Sorted/"
-            category_folder = os.path.join(sorted_folder, category)
-            if not os.path.exists(category_folder):
-                try:
-                    os.makedirs(category_folder)
-                except PermissionError:
-                    logging.error(f"Permission denied when creating {category_folder}")
-                    continue
-
-            # Check if file is already in the correct sorted location
-            potential_new_path = os.path.join(category_folder, filename)
-            if file_path == potential_new_path:
-                skipped_files += 1
-                processed_files += 1
-                continue
-
-            # Check if file is already sorted (maybe from previous run)
-            already_sorted = False
-            for cat in list(FILE_CATEGORIES.keys()) + ["Others"]:
-                check_folder = os.path.join(sorted_folder, cat)
-                if os.path.exists(os.path.join(check_folder, filename)):
-                    already_sorted = True
-                    break
-
-            if already_sorted:
-                skipped_files += 1
-                processed_files += 1
-                continue
-
-            # Get unique filename if needed
-            new_filename = self.get_unique_filename(category_folder, filename)
-            new_file_path = os.path.join(category_folder, new_filename)
-
-            # Move file
-            try:
-                shutil.move(file_path, new_file_path)
-                self.log_move(filename, category)
-                self.save_sorting_history(file_path, new_file_path)
-                moved_files += 1
-            except PermissionError:
-                logging.error(f"Permission denied when moving {filename}")
-            except Exception as e:
-                logging.error(f"Failed to move {filename}: {str(e)}")
+    def start_undo(self):
+        self.undo_sorting()
 
-            processed_files += 1
+    def run_in_background(self, task, on_finished):
+        """Starts task on a worker thread; on_finished gets its summary."""
+        self.worker_thread = QThread(self)
+        self.worker = EngineWorker(task)
+        self.worker.moveToThread(self.worker_thread)
+
+        self.worker_thread.started.connect(self.worker.run)
+        self.worker.progress.connect(self.set_progress)
+        self.worker.finished.connect(on_finished)
+        self.worker.failed.connect(self.show_task_error)
+        self.worker.finished.connect(self.worker_thread.quit)
+        self.worker.failed.connect(self.worker_thread.quit)
+        self.worker_thread.finished.connect(self.task_done)
+
+        self.set_busy(True)
+        self.worker_thread.start()
+
+    def set_busy(self, busy):
+        """Locks the actions and shows progress while a task is running."""
+        self.sort_button.setEnabled(not busy)
+        self.preview_button.setEnabled(not busy)
+        self.undo_button.setEnabled(not busy)
+        self.cancel_button.setEnabled(True)
+        self.cancel_button.setVisible(busy)
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setVisible(busy)
 
-        self.progress_bar.setValue(100)
+    def set_progress(self, value):
+        """Shows a percentage, or a busy indicator when value is -1."""
+        if value < 0:
+            self.progress_bar.setRange(0, 0)
+        else:
+            self.progress_bar.setRange(0, 100)
+            self.progress_bar.setValue(value)
+
+    def cancel_task(self):
+        if self.worker is not None:
+            self.cancel_button.setEnabled(False)
+            self.worker.cancel()
+
+    def task_done(self):
+        self.worker.deleteLater()
+        self.worker_thread.deleteLater()
+        self.worker = None
+        self.worker_thread = None
+        self.set_busy(False)
+
+    def show_task_error(self, message):
+        QMessageBox.critical(self, "Error", message)
+
+    def organize_directory(self, directory, keep_existing=True, recursive=False, sniff=False,
+                           dedup=False, incremental=False, verify=False):
+        """Sorts files into categorized folders inside a 'Sorted' directory."""
+        sniffer = ContentSniffer() if sniff else None
+        deduplicator = Deduplicator("skip") if dedup else None
+
+        def task(progress, cancel):
+            # Custom rules from ~/file_organizer_rules.json, if the user wrote one
+            rules = load_rules()
+            # SQLite connections belong to the thread that opened them
+            state = None
+            if incremental and os.path.isdir(directory):
+                state = open_state(directory, recursive, None, None, None,
+                                   sniffer and sniffer.mode, deduplicator and deduplicator.mode,
+                                   rules and rules.path)
+            try:
+                return organize_directory(directory, keep_existing, self.history, progress, cancel,
+                                          recursive=recursive, sniffer=sniffer,
+                                          deduplicator=deduplicator, state=state, rules=rules,
+                                          verify=verify)
+            finally:
+                if state is not None:
+                    state.close()
+
+        self.run_in_background(task, self.show_organize_summary)
+
+    def show_organize_summary(self, summary):
+        if not any(summary):
+            QMessageBox.information(self, "Info", "No files found to organize in the selected folder.")
+            return
 
         # Show summary of operations
-        summary = []
-        if moved_files > 0:
-            summary.append(f"✓ Organized {moved_files} new files")
-        if skipped_files > 0:
-            summary.append(f"⏩ Skipped {skipped_files} already organized files")
-
-        if summary:
+        summary_lines = []
+        if summary.moved > 0:
+            summary_lines.append(f"✓ Organized {summary.moved} new files")
+        if summary.skipped > 0:
+            summary_lines.append(f"⏩ Skipped {summary.skipped} already organized files")
+        if summary.failed > 0:
+            summary_lines.append(f"✗ Failed to move {summary.failed} files")
+        if summary.duplicates > 0:
+            summary_lines.append(f"≡ Found {summary.duplicates} duplicate files")
+        if summary.cancelled:
+            summary_lines.append("Stopped before all files were processed")
+
+        if summary_lines:
             msg = QMessageBox(self)
-            msg.setWindowTitle("Organization Complete")
+            msg.setWindowTitle("Organization Cancelled" if summary.cancelled else "Organization Complete")
             msg.setIcon(QMessageBox.Information)
-            msg.setText("\n".join(summary))
+            msg.setText("\n".join(summary_lines))
             msg.exec_()
         else:
             QMessageBox.information(self, "Info", "No files needed to be organized.")
 
     def undo_sorting(self):
-        """Moves files back to their original locations."""
-        if not os.path.exists(HISTORY_FILE):
+        """Moves the files of a chosen run back to their original locations."""
+        runs = [info for info in self.history.runs() if info.status != "running"]
+        if not runs:
             QMessageBox.information(self, "Info", "No previous organization to undo.")
             return
 
+        # Newest run first, so the default choice is the last action
+        labels = []
+        for info in runs:
+            started = time.strftime("%Y-%m-%d %H:%M", time.localtime(info.started)) if info.started else "?"
+            labels.append(f"{started} — {info.moves or 0} files in {info.directory or '?'}")
+        labels.append("All runs")
+        choice, ok = QInputDialog.getItem(self, "Undo", "Which organization should be undone?",
+                                          labels, 0, False)
+        if not ok:
+            return
+        run_id = None if choice == labels[-1] else runs[labels.index(choice)].run_id
+
         reply = QMessageBox.question(self, 'Confirm Undo',
-                                     "This will move all files back to their original locations.\nDo you want to continue?",
+                                     "This will move the files back to their original locations.\nDo you want to continue?",
                                      QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
 
         if reply != QMessageBox.Yes:
             return
 
-        try:
-            with open(HISTORY_FILE, "r") as f:
-                history = json.load(f)
-        except json.JSONDecodeError:
-            QMessageBox.critical(self, "Error", "Failed to read history file. It may be corrupted.")
-            return
+        def task(progress, cancel):
+            return undo_history(self.history, progress, cancel, run_id, workers=4)
 
-        total_files = len(history)
-        processed_files = 0
-        restored_files = 0
-        failed_files = 0
-
-        for new_path, original_path in history.items():
-            self.progress_bar.setValue(int((processed_files / total_files) * 100))
-            QApplication.processEvents()  # Keep UI responsive
-
-            if os.path.exists(new_path):
-                try:
-                    # Ensure the original directory exists
-                    original_dir = os.path.dirname(original_path)
-                    if not os.path.exists(original_dir):
-                        os.makedirs(original_dir)
-
-                    shutil.move(new_path, original_path)
-                    restored_files += 1
-                except PermissionError:
-                    logging.error(f"Permission denied when restoring {new_path}")
-                    failed_files += 1
-                except Exception as e:
-                    logging.error(f"Failed to restore {new_path}: {str(e)}")
-                    failed_files += 1
-            else:
-                logging.warning(f"File not found: {new_path}")
-                failed_files += 1
-
-            processed_files += 1
-
-        self.progress_bar.setValue(100)
-
-        # Clear history after undo
-        try:
-            if os.path.exists(HISTORY_FILE):
-                os.remove(HISTORY_FILE)
-        except PermissionError:
-            logging.error(f"Permission denied when removing {HISTORY_FILE}")
+        self.run_in_background(task, self.show_undo_summary)
 
+    def show_undo_summary(self, summary):
         # Show summary
-        summary = []
-        if restored_files > 0:
-            summary.append(f"✓ Restored {restored_files} files")
-        if failed_files > 0:
-            summary.append(f"✗ Failed to restore {failed_files} files")
-
-        if summary:
-            QMessageBox.information(self, "Undo Complete", "\n".join(summary))
+        summary_lines = []
+        if summary.restored > 0:
+            summary_lines.append(f"✓ Restored {summary.restored} files")
+        if summary.failed > 0:
+            summary_lines.append(f"✗ Failed to restore {summary.failed} files")
+        if summary.cancelled:
+            summary_lines.append("Stopped early; the remaining files can still be undone")
+
+        if summary_lines:
+            QMessageBox.information(self, "Undo Complete", "\n".join(summary_lines))
         else:
             QMessageBox.information(self, "Info", "No files were restored.")
 
+    def closeEvent(self, event):
+        """Stops a running task cleanly before the window closes."""
+        if self.worker_thread is not None:
+            self.worker.cancel()
+            self.worker_thread.quit()
+            self.worker_thread.wait()
+        super().closeEvent(event)
+
 
 if __name__ == "__main__":
     # Enable high DPI scaling for Windows
@@ -0,0 +1,20 @@
+"""Headless file organizer engine.
+
+Importing this package never loads Qt, so it can be used from scripts and
+cron jobs; file_organizer.py is a GUI client on top of it.
+"""
+from .categories import FILE_CATEGORIES, OTHERS_CATEGORY, classify
+from .history import HISTORY_DIR, HistoryJournal
+from .models import (InterruptedRun, OrganizeError, OrganizeSummary, PlanEntry, RunInfo,
+                     UndoSummary)
+from .executor import execute_batched, execute_parallel, execute_plan
+from .engine import (SORTED_FOLDER_NAME, build_plan, organize_directory, plan_moves, run_plan,
+                     undo_history)
+from .planfile import read_plan, write_plan
+from .sniff import ContentSniffer
+from .dedup import Deduplicator
+from .state import IncrementalState, open_state
+from .recovery import find_interrupted_runs, resume_run, rollback_run
+from .metrics import Metrics, queue_logging
+from .rules import RuleSet, load_rules
+from .preview import PlanPreview
@@ -0,0 +1,79 @@
+"""File type categories used to decide where each file is sorted."""
+from types import MappingProxyType
+
+# File type categories
+FILE_CATEGORIES = {
+    "Images": [".jpg", ".jpeg", ".png", ".gif", ".bmp", ".svg", ".webp"],
+    "Videos": [".mp4", ".mkv", ".flv", ".avi", ".mov", ".wmv"],
+    "Documents": [".pdf", ".docx", ".doc", ".txt", ".xlsx", ".pptx", ".csv"],
+    "Music": [".mp3", ".wav", ".aac", ".flac", ".ogg"],
+    "Archives": [".zip", ".rar", ".7z", ".tar", ".gz", ".tar.gz", ".tar.bz2", ".tar.xz", ".tgz"],
+    "Executables": [".exe", ".msi", ".sh", ".bat"],
+    "Code": [".py", ".js", ".html", ".css", ".cpp", ".java", ".c", ".php"]
+}
+
+# Category for anything not listed above
+OTHERS_CATEGORY = "Others"
+
+
+class ExtensionIndex:
+    """Read-only extension → category map built once from a categories dict.
+
+    Lookups are case-insensitive and prefer the longest matching suffix, so
+    "backup.TAR.GZ" matches ".tar.gz" before ".gz".  Classifying a file
+    costs at most one dict lookup per dot in the longest configured
+    extension, independent of how many categories there are.
+    """
+
+    def __init__(self, categories):
+        mapping = {}
+        for category, extensions in categories.items():
+            for ext in extensions:
+                # Like the old linear scan, the first category listing an extension wins
+                mapping.setdefault(ext.lower(), category)
+        self.mapping = MappingProxyType(mapping)
+        self.categories = tuple(categories)
+        self.max_parts = max((ext.count(".") for ext in mapping), default=1)
+
+    def classify(self, filename):
+        """Returns the category for filename, or Others if nothing matches."""
+        name = filename.lower()
+        end = len(name)
+        category = OTHERS_CATEGORY
+        for _ in range(self.max_parts):
+            end = name.rfind(".", 0, end)
+            if end <= 0:  # No dot, or only a leading one as in ".bashrc"
+                break
+            match = self.mapping.get(name[end:])
+            if match is not None:
+                category = match
+        return category
+
+    def split(self, filename):
+        """Splits filename into (stem, extension), keeping known multi-part extensions whole."""
+        name = filename.lower()
+        end = len(name)
+        split_at = None
+        for part in range(self.max_parts):
+            end = name.rfind(".", 0, end)
+            if end <= 0:
+                break
+            if part == 0 or name[end:] in self.mapping:
+                split_at = end
+        if split_at is None:
+            return filename, ""
+        return filename[:split_at], filename[split_at:]
+
+
+# Index for the built-in categories
+EXTENSION_INDEX = ExtensionIndex(FILE_CATEGORIES)
+
+
+def all_categories(index=EXTENSION_INDEX):
+    """Returns every category folder name, including Others."""
+    return list(index.categories) + [OTHERS_CATEGORY]
+
+
+def classify(filename, index=EXTENSION_INDEX):
+    """Returns the category a file belongs to based on its extension."""
+    return index.classify(filename)
@@ -0,0 +1,310 @@
+"""Command line entry point: python -m organizer."""
+import os
+import sys
+import time
+import signal
+import argparse
+import threading
+from contextlib import nullcontext
+
+from .engine import OrganizeError, build_plan, organize_directory, run_plan, undo_history
+from .history import HistoryJournal
+from .recovery import find_interrupted_runs, resume_run, rollback_run
+from .planfile import count_plan_entries, read_plan, read_plan_header, write_plan
+from .dedup import DEDUP_MODES, Deduplicator
+from .sniff import ContentSniffer
+from .metrics import Metrics, queue_logging
+from .rules import load_rules
+from .state import open_state
+from .watch import DEFAULT_IGNORE, Watcher
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m organizer",
+        description="Sort files into categorized folders without the GUI.")
+    parser.add_argument("--log-file", default="file_sorting.log",
+                        help="where to write the move log (default: %(default)s)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    # Options that decide what gets sorted where
+    selection = argparse.ArgumentParser(add_help=False)
+    selection.add_argument("directory")
+    selection.add_argument("--reset", action="store_true",
+                           help="remove existing category folders before sorting")
+    selection.add_argument("-r", "--recursive", action="store_true",
+                           help="also sort files in subfolders")
+    selection.add_argument("--max-depth", type=int, default=None,
+                           help="with --recursive, how many folder levels to descend")
+    selection.add_argument("--include", action="append", metavar="GLOB",
+                           help="only sort files matching this pattern (repeatable)")
+    selection.add_argument("--exclude", action="append", metavar="GLOB",
+                           help="skip files and folders matching this pattern (repeatable)")
+    selection.add_argument("--sniff", choices=["unknown", "all"], default=None,
+                           help="detect file types from content: for unknown extensions, or for all files")
+    selection.add_argument("--dedup", choices=DEDUP_MODES, default=None,
+                           help="find identical files and skip them, hard-link them, or move them to Sorted/Duplicates")
+
+    selection.add_argument("--rules", metavar="FILE", default=None,
+                           help="sorting rules file (default: ~/file_organizer_rules.json if it exists)")
+    selection.add_argument("--incremental", action="store_true",
+                           help="only process files that are new or changed since the last incremental run")
+
+    # Options that decide how moves are carried out
+    execution = argparse.ArgumentParser(add_help=False)
+    execution.add_argument("--workers", type=int, default=1,
+                           help="move files on this many threads (default: %(default)s)")
+    execution.add_argument("--per-device", type=int, default=None,
+                           help="max concurrent cross-device moves per device pair (default: --workers)")
+    execution.add_argument("--batch", action="store_true",
+                           help="create all folders first and move files folder by folder, "
+                                "logging in batches (fastest for huge folders on a local disk)")
+    execution.add_argument("--verify", action="store_true",
+                           help="checksum files copied to another filesystem before deleting the original")
+    execution.add_argument("--metrics", metavar="FILE",
+                           help="write per-phase counters and timings to this JSON file")
+    execution.add_argument("--profile", metavar="FILE",
+                           help="profile the run with cProfile and write the stats to this file")
+    execution.add_argument("--trace-memory", action="store_true",
+                           help="record peak memory and top allocation sites in the metrics")
+
+    commands.add_parser("organize", parents=[selection, execution],
+                        help="sort the files in a folder")
+
+    plan = commands.add_parser("plan", parents=[selection],
+                               help="write the moves an organize run would make, without moving anything")
+    plan.add_argument("-o", "--output", required=True, help="plan file to write (JSON Lines)")
+
+    apply = commands.add_parser("apply", parents=[execution], help="carry out a saved plan file")
+    apply.add_argument("plan_file")
+
+    watch = commands.add_parser("watch", help="keep a folder organized as new files arrive")
+    watch.add_argument("directory")
+    watch.add_argument("-r", "--recursive", action="store_true",
+                       help="also watch subfolders")
+    watch.add_argument("--settle", type=float, default=0.5,
+                       help="seconds a file must stay unchanged before it is moved (default: %(default)s)")
+    watch.add_argument("--poll", action="store_true",
+                       help="poll with periodic scans instead of using inotify")
+    watch.add_argument("--interval", type=float, default=1.0,
+                       help="seconds between scans when polling (default: %(default)s)")
+    watch.add_argument("--ignore", action="append", metavar="GLOB",
+                       help="also leave files matching this pattern alone (repeatable)")
+    watch.add_argument("--sniff", choices=["unknown", "all"], default=None,
+                       help="detect file types from content")
+    watch.add_argument("--rules", metavar="FILE", default=None,
+                       help="sorting rules file (default: ~/file_organizer_rules.json if it exists)")
+
+    recover = commands.add_parser("recover", parents=[execution],
+                                  help="list, resume or roll back runs that were interrupted")
+    action = recover.add_mutually_exclusive_group()
+    action.add_argument("--resume", action="store_true",
+                        help="finish the interrupted runs with their original settings")
+    action.add_argument("--rollback", action="store_true",
+                        help="move the files of the interrupted runs back")
+
+    commands.add_parser("history", help="list the runs that can be undone")
+
+    undo = commands.add_parser("undo", help="move the files of the last run back")
+    which = undo.add_mutually_exclusive_group()
+    which.add_argument("--run", metavar="RUN_ID",
+                       help="undo this run instead of the last one (see the history command)")
+    which.add_argument("--all", action="store_true",
+                       help="undo every finished run, newest first")
+    undo.add_argument("--workers", type=int, default=1,
+                      help="restore files on this many threads (default: %(default)s)")
+    undo.add_argument("-y", "--yes", action="store_true",
+                      help="do not ask for confirmation")
+    return parser
+
+
+def make_sniffer(args):
+    return ContentSniffer(args.sniff) if args.sniff else None
+
+
+def make_deduplicator(args):
+    return Deduplicator(args.dedup) if args.dedup else None
+
+
+def make_state(args, rules):
+    if not args.incremental:
+        return None
+    return open_state(args.directory, args.recursive, args.max_depth, args.include,
+                      args.exclude, args.sniff, args.dedup, rules and rules.path)
+
+
+def make_metrics(args):
+    if not (args.metrics or args.profile or args.trace_memory):
+        return None
+    return Metrics(profile=bool(args.profile), trace_memory=args.trace_memory)
+
+
+def report_metrics(metrics, args):
+    metrics.log_summary()
+    rates = metrics.rates()
+    print(f"{metrics.elapsed:.2f}s, {rates['files_per_sec'] or 0:.0f} files/s, "
+          f"{(rates['bytes_per_sec'] or 0) / 1e6:.1f} MB/s")
+    if args.metrics:
+        metrics.save(args.metrics)
+    if args.profile:
+        metrics.save_profile(args.profile)
+
+
+def print_summary(summary):
+    print(f"Organized {summary.moved} files, skipped {summary.skipped}, failed {summary.failed}")
+    if summary.duplicates:
+        print(f"{summary.duplicates} of them were duplicates")
+
+
+def run_organize(args):
+    rules = load_rules(args.rules)
+    metrics = make_metrics(args)
+    with metrics.run() if metrics else nullcontext():
+        summary = organize_directory(args.directory, keep_existing=not args.reset,
+                                     workers=args.workers, per_device=args.per_device,
+                                     recursive=args.recursive, max_depth=args.max_depth,
+                                     include=args.include, exclude=args.exclude,
+                                     sniffer=make_sniffer(args),
+                                     deduplicator=make_deduplicator(args),
+                                     state=make_state(args, rules), metrics=metrics,
+                                     rules=rules, verify=args.verify, batch=args.batch)
+    print_summary(summary)
+    if metrics:
+        report_metrics(metrics, args)
+    return 1 if summary.failed else 0
+
+
+def run_plan_command(args):
+    rules = load_rules(args.rules)
+    entries, _ = build_plan(args.directory, keep_existing=not args.reset,
+                            recursive=args.recursive, max_depth=args.max_depth,
+                            include=args.include, exclude=args.exclude,
+                            sniffer=make_sniffer(args),
+                            deduplicator=make_deduplicator(args),
+                            state=make_state(args, rules), rules=rules)
+    counts = write_plan(args.output, entries or [], args.directory)
+    print(f"Planned {counts['move']} moves, {counts['link']} duplicate links, {counts['skip']} skips, "
+          f"{counts['clear']} category folders to remove → {args.output}")
+    return 0
+
+
+def run_apply(args):
+    header = read_plan_header(args.plan_file)
+    total = count_plan_entries(args.plan_file)
+    print(f"Applying plan for {header['directory']} ({total} entries)")
+    metrics = make_metrics(args)
+    with metrics.run() if metrics else nullcontext():
+        summary = run_plan(read_plan(args.plan_file), total,
+                           workers=args.workers, per_device=args.per_device,
+                           directory=header["directory"],
+                           options={"plan": os.path.abspath(args.plan_file), "verify": args.verify},
+                           metrics=metrics, verify=args.verify, batch=args.batch)
+    print_summary(summary)
+    if metrics:
+        report_metrics(metrics, args)
+    return 1 if summary.failed else 0
+
+
+def run_watch(args):
+    if not os.path.isdir(args.directory):
+        raise OrganizeError("The selected folder does not exist.")
+
+    cancel = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: cancel.set())
+    watcher = Watcher(args.directory, recursive=args.recursive, settle=args.settle,
+                      ignore=DEFAULT_IGNORE + (args.ignore or []), sniffer=make_sniffer(args),
+                      poll=args.poll, poll_interval=args.interval, rules=load_rules(args.rules))
+    print(f"Watching {args.directory} (Ctrl+C to stop)")
+    try:
+        watcher.run(cancel, on_batch=print_summary)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def format_time(timestamp):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp)) if timestamp else "?"
+
+
+def describe_run(run):
+    return (f"{run.run_id} in {run.directory} (started {format_time(run.started)}): "
+            f"{len(run.committed)} moved, {len(run.pending)} in flight")
+
+
+def run_recover(args):
+    runs = find_interrupted_runs()
+    if not runs:
+        print("No interrupted runs.")
+        return 0
+    exit_code = 0
+    for run in runs:
+        print(describe_run(run))
+        if args.resume:
+            summary = resume_run(run, workers=args.workers, per_device=args.per_device)
+            print_summary(summary)
+        elif args.rollback:
+            summary = rollback_run(run, workers=args.workers)
+            print(f"Restored {summary.restored} files, failed {summary.failed}")
+        else:
+            continue
+        if summary.failed:
+            exit_code = 1
+    if not (args.resume or args.rollback):
+        print("Use --resume to finish these runs or --rollback to undo them.")
+    return exit_code
+
+
+def warn_interrupted():
+    """Points at the recover command when an earlier run did not finish."""
+    runs = find_interrupted_runs()
+    for run in runs:
+        print(f"Warning: run {describe_run(run)} was interrupted", file=sys.stderr)
+    if runs:
+        print("Run 'python -m organizer recover --resume' or '--rollback' to deal with it.",
+              file=sys.stderr)
+
+
+def run_history(args):
+    runs = HistoryJournal().runs()
+    if not runs:
+        print("No previous organization to undo.")
+        return 0
+    for info in runs:
+        moves = "?" if info.moves is None else info.moves
+        print(f"{info.run_id}  {format_time(info.started)}  {info.status:<9}  "
+              f"{moves:>7} files  {info.directory or '?'}")
+    return 0
+
+
+def run_undo(args):
+    history = HistoryJournal()
+    finished = [info for info in history.runs() if info.status != "running"]
+    if not finished:
+        print("No previous organization to undo.")
+        return 0
+    run_id = None if args.all else args.run or finished[0].run_id
+    if not args.yes:
+        scope = "every recorded run" if args.all else f"run {run_id}"
+        reply = input(f"This will move the files of {scope} back to their original locations. "
+                      f"Continue? [y/N] ")
+        if reply.strip().lower() not in ("y", "yes"):
+            return 1
+    summary = undo_history(history, run_id=run_id, workers=args.workers)
+    print(f"Restored {summary.restored} files, failed {summary.failed}")
+    return 1 if summary.failed else 0
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    queue_logging(args.log_file)
+
+    handlers = {"organize": run_organize, "plan": run_plan_command,
+                "apply": run_apply, "watch": run_watch, "recover": run_recover,
+                "history": run_history, "undo": run_undo}
+    try:
+        if args.command not in ("recover", "history"):
+            warn_interrupted()
+        return handlers[args.command](args)
+    except OrganizeError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
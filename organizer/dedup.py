@@ -0,0 +1,158 @@
+"""Duplicate detection for organize runs.
+
+Files are narrowed down in stages so that as little data as possible is
+read: first they are grouped by size (files with a unique size are never
+opened, and empty files are never treated as duplicates), then by a hash
+of their first and last block, and only files that still collide get a
+full streaming hash, computed in a process pool.
+"""
+import os
+import hashlib
+import logging
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from .scan import walk_files
+
+logger = logging.getLogger(__name__)
+
+# Bytes hashed at each end of a file in the partial-hash stage
+PARTIAL_BLOCK = 64 * 1024
+
+# Read size for full hashes
+FULL_HASH_CHUNK = 1024 * 1024
+
+# Folder inside Sorted/ that quarantined duplicates are moved to
+DUPLICATES_FOLDER = "Duplicates"
+
+DEDUP_MODES = ("skip", "hardlink", "quarantine")
+
+
+def partial_hash(path, size, block=PARTIAL_BLOCK):
+    """Hashes the first and last block of a file (the whole file if it is small)."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        digest.update(f.read(block))
+        if size > 2 * block:
+            f.seek(size - block)
+            digest.update(f.read(block))
+        elif size > block:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def full_hash(path):
+    """Hashes a whole file in chunks; runs in a worker process."""
+    digest = hashlib.blake2b(digest_size=32)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(FULL_HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _try(func, *args):
+    try:
+        return func(*args)
+    except OSError as e:
+        logger.warning(f"Could not read {args[0]} for duplicate check: {str(e)}")
+        return None
+
+
+def _try_full_hash(path):
+    return _try(full_hash, path)
+
+
+class Deduplicator:
+    """Finds incoming files that are identical to a sorted or earlier incoming file.
+
+    mode decides what the planner does with a duplicate: "skip" leaves it
+    in place, "hardlink" replaces it with a hard link to the copy that is
+    kept, and "quarantine" moves it to Sorted/Duplicates.
+    """
+
+    def __init__(self, mode="skip", workers=None, processes=None):
+        if mode not in DEDUP_MODES:
+            raise ValueError(f"Unknown dedup mode: {mode}")
+        self.mode = mode
+        self.workers = workers or min(32, (os.cpu_count() or 1) * 4)
+        self.processes = processes
+
+    def find(self, directory, sorted_folder, classified):
+        """Returns (items, duplicates) for a stream of (rel_path, category) pairs.
+
+        items is the stream materialized as a list, since every file has to
+        be seen before any can be called unique.  duplicates maps the
+        rel_path of each duplicate to the absolute path of the copy to keep:
+        a file already in sorted_folder if there is one, otherwise the
+        first incoming copy.  Pass sorted_folder=None to ignore sorted files.
+        """
+        items = list(classified)
+
+        # Stage 1: group by size; existing sorted files first so they are kept
+        by_size = defaultdict(list)
+        if sorted_folder and os.path.isdir(sorted_folder):
+            for rel_path in walk_files(sorted_folder):
+                path = os.path.join(sorted_folder, rel_path)
+                try:
+                    by_size[os.stat(path).st_size].append((path, None))
+                except OSError:
+                    continue
+        for rel_path, _ in items:
+            path = os.path.join(directory, rel_path)
+            try:
+                by_size[os.stat(path).st_size].append((path, rel_path))
+            except OSError:
+                continue
+
+        # Empty files are not duplicates of each other: each is usually a
+        # placeholder or marker that matters by name, not content
+        candidates = [(size, group) for size, group in by_size.items()
+                      if size and len(group) > 1 and any(rel for _, rel in group)]
+        by_size = None
+        if not candidates:
+            return items, {}
+
+        # Stage 2: first and last block, read in parallel threads
+        jobs = [(path, size) for size, group in candidates for path, _ in group]
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            partials = list(pool.map(lambda job: _try(partial_hash, *job), jobs))
+
+        by_partial = defaultdict(list)
+        position = 0
+        for size, group in candidates:
+            for member in group:
+                digest = partials[position]
+                position += 1
+                if digest is not None:
+                    by_partial[(size, digest)].append(member)
+
+        # Stage 3: full hash, only where the partial hash did not cover the whole file
+        groups = []
+        full_jobs = []
+        for (size, _), group in by_partial.items():
+            if len(group) < 2 or not any(rel for _, rel in group):
+                continue
+            if size <= 2 * PARTIAL_BLOCK:
+                groups.append(group)
+            else:
+                full_jobs.append(group)
+
+        if full_jobs:
+            paths = [path for group in full_jobs for path, _ in group]
+            with ProcessPoolExecutor(max_workers=self.processes) as pool:
+                digests = iter(list(pool.map(_try_full_hash, paths, chunksize=16)))
+            for group in full_jobs:
+                by_full = defaultdict(list)
+                for member in group:
+                    digest = next(digests)
+                    if digest is not None:
+                        by_full[digest].append(member)
+                groups.extend(g for g in by_full.values() if len(g) > 1)
+
+        duplicates = {}
+        for group in groups:
+            keep = group[0][0]
+            for _, rel_path in group[1:]:
+                if rel_path is not None:
+                    duplicates[rel_path] = keep
+        return items, duplicates
@@ -0,0 +1,317 @@
+"""Qt-free sorting engine: plan which files go where, then execute the plan."""
+import os
+import logging
+import itertools
+
+from .categories import all_categories, classify
+from .dedup import DUPLICATES_FOLDER
+from .executor import execute_batched, execute_parallel, execute_plan, execute_restore
+from .history import HistoryJournal
+from .metrics import measure, timed
+from .models import OrganizeError, OrganizeSummary, PlanEntry, UndoSummary
+from .names import NameAllocator
+from .scan import SortedIndex, scan_directory, walk_files
+
+logger = logging.getLogger(__name__)
+
+# Name of the output folder created inside the organized directory
+SORTED_FOLDER_NAME = "Sorted"
+
+
+def list_files(directory):
+    """Returns the visible regular files directly inside directory."""
+    try:
+        return [entry.name for entry in scan_directory(directory)]
+    except PermissionError:
+        raise OrganizeError(f"Permission denied when accessing {directory}")
+
+
+def plan_clear(sorted_folder, categories=None):
+    """Returns "clear" entries for the category folders that currently exist."""
+    entries = []
+    for category in all_categories() if categories is None else categories:
+        category_folder = os.path.join(sorted_folder, category)
+        if os.path.isdir(category_folder):
+            entries.append(PlanEntry("clear", category_folder, None, category))
+    return entries
+
+
+def classify_files(directory, files, sniffer=None, rules=None):
+    """Yields (rel_path, category) for files given relative to directory.
+
+    Without a sniffer only the extension is used; with a ContentSniffer,
+    file contents decide where the extension does not.  With a RuleSet the
+    category is the rule's destination folder, which may be nested (e.g.
+    Images/2024/05).
+    """
+    if sniffer is not None:
+        return sniffer.classify(directory, files, rules and rules.classify_path)
+    if rules is not None:
+        return rules.classify(directory, files)
+    return ((rel_path, classify(os.path.basename(rel_path))) for rel_path in files)
+
+
+def plan_moves(directory, classified, index=None, skip_sorted_names=True,
+               duplicates=None, dedup_mode=None):
+    """Yields a PlanEntry for each file, deciding its final name.
+
+    classified yields (rel_path, category) pairs with paths relative to
+    directory, as produced by classify_files.  Conflicts are checked against a
+    SortedIndex listing taken once when planning starts, so no per-file
+    existence checks hit the disk.  With skip_sorted_names, a file whose
+    name already exists in any category folder is treated as sorted.
+    duplicates maps rel_paths to the identical file to keep (see
+    Deduplicator.find); dedup_mode says how those files are planned.
+    """
+    sorted_folder = os.path.join(directory, SORTED_FOLDER_NAME)
+    if index is None:
+        index = SortedIndex(sorted_folder)
+    allocators = {}
+    planned = {}
+
+    def allocate(folder, filename):
+        allocator = allocators.get(folder)
+        if allocator is None:
+            allocator = allocators[folder] = NameAllocator(index.names(folder))
+        return os.path.join(folder, allocator.allocate(filename))
+
+    for rel_path, category in classified:
+        file_path = os.path.join(directory, rel_path)
+        filename = os.path.basename(rel_path)
+        category_folder = os.path.join(sorted_folder, category)
+
+        # Check if file is already in the correct sorted location
+        if file_path == os.path.join(category_folder, filename):
+            yield PlanEntry("skip", file_path, None, category)
+            continue
+
+        # Check if file is already sorted (maybe from previous run)
+        if skip_sorted_names and index.is_sorted(filename):
+            yield PlanEntry("skip", file_path, None, category)
+            continue
+
+        keep = duplicates.get(rel_path) if duplicates else None
+        if keep is not None:
+            # An incoming copy that is kept ends up at its planned destination
+            keep = planned.get(keep, keep)
+            if dedup_mode == "skip":
+                yield PlanEntry("skip", file_path, None, category, keep)
+            elif dedup_mode == "quarantine":
+                destination = allocate(os.path.join(sorted_folder, DUPLICATES_FOLDER), filename)
+                yield PlanEntry("move", file_path, destination, DUPLICATES_FOLDER, keep)
+            else:
+                yield PlanEntry("link", file_path, allocate(category_folder, filename), category, keep)
+            continue
+
+        # Get unique filename if needed
+        destination = allocate(category_folder, filename)
+        if duplicates:
+            planned[file_path] = destination
+        yield PlanEntry("move", file_path, destination, category)
+
+
+def plan_deduplicated(directory, classified, index, skip_sorted_names, deduplicator, keep_existing):
+    """Runs duplicate detection over the classified files, then plans them.
+
+    Detection needs every file before it can plan the first one, so this
+    stage buffers the (rel_path, category) list; it starts only when the
+    plan is first consumed.
+    """
+    sorted_folder = os.path.join(directory, SORTED_FOLDER_NAME)
+    items, duplicates = deduplicator.find(directory, sorted_folder if keep_existing else None,
+                                          classified)
+    yield from plan_moves(directory, items, index, skip_sorted_names,
+                          duplicates, deduplicator.mode)
+
+
+def build_plan(directory, keep_existing=True, recursive=False, max_depth=None,
+               include=None, exclude=None, sniffer=None, deduplicator=None, state=None,
+               metrics=None, rules=None):
+    """Plans an organize run without touching anything on disk.
+
+    Returns (entries, total).  entries streams PlanEntry tuples: "clear"
+    entries first when keep_existing is False, then one "move" or "skip"
+    per file.  total is the number of entries, or None in recursive mode
+    where files are found while the plan is consumed.  entries is None if
+    there is nothing to organize.  sniffer is an optional ContentSniffer,
+    deduplicator an optional Deduplicator and state an optional
+    IncrementalState that filters out folders and files already handled.
+    rules is an optional RuleSet deciding destinations instead of the
+    built-in categories.  With a Metrics, the scan, classify and resolve stages are timed as the
+    plan is consumed.
+    Raises OrganizeError if the directory is missing or unreadable.
+    """
+    if not os.path.exists(directory):
+        raise OrganizeError("The selected folder does not exist.")
+
+    directory = os.path.abspath(directory)
+    sorted_folder = os.path.join(directory, SORTED_FOLDER_NAME)
+
+    if recursive:
+        try:
+            files_to_process = timed(walk_files(directory, max_depth, include, exclude,
+                                                skip_dirs=[sorted_folder], state=state),
+                                     metrics, "scan")
+            first = next(files_to_process, None)
+        except PermissionError:
+            raise OrganizeError(f"Permission denied when accessing {directory}")
+        if first is None:
+            return None, 0
+        files_to_process = itertools.chain([first], files_to_process)
+        total = None
+    else:
+        with measure(metrics, "scan"):
+            if state is not None:
+                try:
+                    files_to_process = list(walk_files(directory, max_depth=0, state=state))
+                except PermissionError:
+                    raise OrganizeError(f"Permission denied when accessing {directory}")
+            else:
+                files_to_process = list_files(directory)
+        if not files_to_process:
+            return None, 0
+        total = len(files_to_process)
+
+    # If not keeping existing, previous sorted folders are removed first
+    clear_entries = [] if keep_existing else plan_clear(sorted_folder,
+                                                        rules and rules.top_folders())
+    if total is not None:
+        total += len(clear_entries)
+
+    index = SortedIndex(sorted_folder, not keep_existing, rules and rules.folders())
+    classified = timed(classify_files(directory, files_to_process, sniffer, rules), metrics,
+                       "classify")
+    if deduplicator is not None:
+        moves = plan_deduplicated(directory, classified, index, not recursive, deduplicator,
+                                  keep_existing)
+    else:
+        moves = plan_moves(directory, classified, index, skip_sorted_names=not recursive)
+    if state is not None:
+        moves = state.track(moves)
+    return itertools.chain(clear_entries, timed(moves, metrics, "resolve")), total
+
+
+def run_plan(entries, total=None, history=None, progress=None, cancel=None,
+             workers=1, per_device=None, directory=None, options=None, metrics=None,
+             verify=False, batch=False):
+    """Executes a plan, serially or with workers > 1 on a thread pool.
+
+    With batch, the plan runs through execute_batched instead (folders
+    created up front, moves grouped by folder); workers is then ignored.
+
+    Unless history already has a run open (a resumed run, or watch mode),
+    the plan runs as a new run: directory and options are stored in its
+    begin record so an interrupted run can be resumed with the same
+    settings, and the run is ended once the executor returns.  If the
+    process dies first, the run stays open for recovery.  With verify,
+    files copied to another filesystem are checksummed against their
+    source before it is deleted.
+    """
+    if history is None:
+        history = HistoryJournal()
+    own_run = history.run_id is None
+    if own_run:
+        history.begin_run(directory, options)
+    if batch:
+        summary = execute_batched(entries, history, total, progress, cancel, metrics=metrics,
+                                  verify=verify)
+    elif workers > 1:
+        summary = execute_parallel(entries, history, total, progress, cancel, workers, per_device,
+                                   metrics=metrics, verify=verify)
+    else:
+        summary = execute_plan(entries, history, total, progress, cancel, metrics=metrics,
+                               verify=verify)
+    if own_run:
+        try:
+            history.end_run("cancelled" if summary.cancelled else "done")
+        except OSError as e:
+            logger.error(f"Failed to write history file: {str(e)}")
+    return summary
+
+
+def organize_directory(directory, keep_existing=True, history=None, progress=None, cancel=None,
+                       workers=1, per_device=None, recursive=False, max_depth=None,
+                       include=None, exclude=None, sniffer=None, deduplicator=None,
+                       state=None, metrics=None, rules=None, verify=False, batch=False):
+    """Sorts files into categorized folders inside a 'Sorted' directory.
+
+    With workers > 1 the moves run on a thread pool (see execute_parallel).
+    With recursive, files in subfolders are streamed through the pipeline
+    as the tree is walked (see walk_files); the total is then unknown and
+    progress is called with total=None.  With an IncrementalState, only
+    new or changed files are processed and the state is saved afterwards
+    unless the run was cancelled.  metrics is an optional Metrics (see
+    organizer.metrics); verify and batch are passed on to run_plan.
+    Raises OrganizeError if the directory is missing or unreadable.
+    """
+    entries, total = build_plan(directory, keep_existing, recursive, max_depth, include, exclude,
+                                sniffer, deduplicator, state, metrics, rules)
+    if entries is None:
+        if state is not None:
+            state.commit()
+        return OrganizeSummary(0, 0, 0)
+
+    # Create Sorted folder if it doesn't exist
+    sorted_folder = os.path.join(os.path.abspath(directory), SORTED_FOLDER_NAME)
+    try:
+        os.makedirs(sorted_folder, exist_ok=True)
+    except PermissionError:
+        raise OrganizeError(f"Permission denied when creating {sorted_folder}")
+
+    options = {"recursive": recursive, "max_depth": max_depth, "include": include,
+               "exclude": exclude, "sniff": sniffer and sniffer.mode,
+               "dedup": deduplicator and deduplicator.mode, "rules": rules and rules.path,
+               "verify": verify}
+    summary = run_plan(entries, total, history, progress, cancel, workers, per_device,
+                       os.path.abspath(directory), options, metrics, verify, batch)
+    if state is not None and not summary.cancelled:
+        state.commit()
+    return summary
+
+
+def undo_history(history=None, progress=None, cancel=None, run_id=None, workers=1):
+    """Moves files recorded in the history back to their original locations.
+
+    With run_id only that run is undone; otherwise every finished run is,
+    newest first.  Interrupted runs are left to resume_run/rollback_run.
+    Each run is restored in batches (see execute_restore), with workers > 1
+    on a thread pool, and removed from the history once it has been undone.
+    progress is called as progress(done, total).  If cancel is set part way,
+    the files already restored are marked as undone and the rest of the
+    run can still be undone later.
+    Raises OrganizeError if run_id is not a finished run in the history.
+    """
+    if history is None:
+        history = HistoryJournal()
+
+    runs = [info for info in history.runs() if info.status != "running"]
+    if run_id is not None:
+        runs = [info for info in runs if info.run_id == run_id]
+        if not runs:
+            raise OrganizeError(f"No finished run {run_id} in the undo history.")
+
+    total = sum(info.moves or 0 for info in runs) or None
+    restored_files = 0
+    failed_files = 0
+
+    for info in runs:
+        offset = restored_files + failed_files
+        report = None
+        if progress is not None:
+            def report(done, _, offset=offset):
+                progress(offset + done, total)
+
+        restored, failed, cancelled = execute_restore(history.run_moves(info.run_id), history,
+                                                      info.run_id, total, report, cancel, workers)
+        restored_files += restored
+        failed_files += failed
+        if cancelled:
+            return UndoSummary(restored_files, failed_files, True)
+
+        logger.info(f"Undid run {info.run_id}: restored {restored}, failed {failed}")
+        try:
+            history.forget_run(info.run_id)
+        except OSError as e:
+            logger.error(f"Failed to update history file: {str(e)}")
+
+    return UndoSummary(restored_files, failed_files)
@@ -0,0 +1,514 @@
+"""Executors that carry out planned moves, serially or on a thread pool."""
+import os
+import shutil
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
+
+from .metrics import measure
+from .models import OrganizeSummary
+from .names import link_without_overwrite, move_exclusive, move_without_overwrite
+from .transfer import Transfer
+
+logger = logging.getLogger(__name__)
+
+
+def ensure_folder(folder, created_folders):
+    """Creates a destination folder once per run; returns False on failure."""
+    if folder in created_folders:
+        return True
+    try:
+        os.makedirs(folder, exist_ok=True)
+    except PermissionError:
+        logger.error(f"Permission denied when creating {folder}")
+        return False
+    created_folders.add(folder)
+    return True
+
+
+def prepare_folders(folders, created_folders):
+    """Creates every destination folder in one pass, parents first; returns those that failed."""
+    failed = set()
+    for folder in sorted(folders):
+        if not ensure_folder(folder, created_folders):
+            failed.add(folder)
+    return failed
+
+
+def clear_folder(folder):
+    """Removes a category folder for a "clear" plan entry."""
+    try:
+        shutil.rmtree(folder)
+        logger.info(f"Removed: {folder}")
+    except FileNotFoundError:
+        pass
+    except PermissionError:
+        logger.error(f"Permission denied when removing {folder}")
+
+
+def replace_with_link(source, keep, destination, transfer=None):
+    """Hard-links keep at destination and removes the duplicate at source.
+
+    Falls back to a plain move when a hard link is not possible (different
+    filesystems, or no link support).  Returns the final destination path.
+    """
+    try:
+        final = link_without_overwrite(keep, destination)
+    except OSError as e:
+        logger.warning(f"Could not hard-link {source} to {keep}, moving it instead: {str(e)}")
+        return move_without_overwrite(source, destination, transfer)
+    try:
+        os.unlink(source)
+    except BaseException:
+        os.unlink(final)
+        raise
+    return final
+
+
+def carry_out(entry, metrics=None, transfer=None):
+    """Performs a "move" or "link" entry and returns where the file ended up.
+
+    transfer is the Transfer used when the move crosses filesystems.  With
+    metrics, the move is timed and the file size counted, which costs one
+    extra lstat per file.
+    """
+    if metrics is not None:
+        size = os.lstat(entry.source).st_size
+        with metrics.timer("move"):
+            destination = carry_out(entry, transfer=transfer)
+        metrics.count("bytes_moved", size)
+        return destination
+    if entry.action == "link":
+        return replace_with_link(entry.source, entry.duplicate_of, entry.destination, transfer)
+    return move_without_overwrite(entry.source, entry.destination, transfer)
+
+
+def record_move(entry, error, history, metrics=None):
+    """Logs the outcome of one move and records it for undo; returns True if it moved."""
+    filename = os.path.basename(entry.source)
+    if error is None:
+        if entry.duplicate_of is not None:
+            logger.info(f"Duplicate: {filename} → {entry.category}/ (same as {entry.duplicate_of})")
+        else:
+            logger.info(f"Moved: {filename} → {entry.category}/")
+        with measure(metrics, "history"):
+            history.record(entry.source, entry.destination, linked=entry.action == "link")
+        if metrics is not None:
+            metrics.count("files_moved")
+        return True
+    if metrics is not None:
+        metrics.count("files_failed")
+    if isinstance(error, PermissionError):
+        logger.error(f"Permission denied when moving {filename}")
+    else:
+        logger.error(f"Failed to move {filename}: {str(error)}")
+    return False
+
+
+def restore_move(new_path, original_path, linked=False):
+    """Moves a file back to where it came from; returns True on success.
+
+    A file that has since appeared at original_path is never overwritten;
+    the entry fails instead and the moved file stays where it is.
+    With linked, new_path is a hard link to the copy that was kept, so the
+    file is restored as a copy of its own instead of as one more name of
+    the kept file, which would tie the two together again.
+    """
+    try:
+        # Ensure the original directory exists
+        os.makedirs(os.path.dirname(original_path), exist_ok=True)
+        move_exclusive(new_path, original_path, copy=linked)
+    except FileExistsError:
+        logger.error(f"Cannot restore {new_path}: {original_path} already exists")
+        return False
+    except FileNotFoundError:
+        logger.warning(f"File not found: {new_path}")
+        return False
+    except PermissionError:
+        logger.error(f"Permission denied when restoring {new_path}")
+        return False
+    except Exception as e:
+        logger.error(f"Failed to restore {new_path}: {str(e)}")
+        return False
+    return True
+
+
+def _restore(move):
+    return restore_move(*move)
+
+
+def execute_restore(moves, history, run_id, total=None, progress=None, cancel=None,
+                    workers=1, chunk_size=256):
+    """Moves the files of one run back, chunk by chunk.
+
+    moves yields (new_path, original_path, linked) as from run_moves.  Each chunk is restored
+    on a thread pool when workers > 1, then an undo record is queued per
+    restored file in chunk order, so the history is written in batches
+    just like a forward run.  Returns (restored, failed, cancelled).
+    """
+    restored_files = 0
+    failed_files = 0
+    cancelled = False
+    done = 0
+    moves = iter(moves)
+    pool = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+
+    try:
+        while True:
+            if cancel is not None and cancel.is_set():
+                cancelled = True
+                break
+            chunk = list(islice(moves, chunk_size))
+            if not chunk:
+                break
+            if progress is not None:
+                progress(done, total)
+            results = pool.map(_restore, chunk) if pool is not None else map(_restore, chunk)
+            for (new_path, _, _), ok in zip(chunk, results):
+                if ok:
+                    history.record_undo(run_id, new_path)
+                    restored_files += 1
+                else:
+                    failed_files += 1
+            done += len(chunk)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        history.flush()
+    return restored_files, failed_files, cancelled
+
+
+def finish_run(history, total, progress, cancelled, metrics=None):
+    """Flushes the history and reports completion."""
+    try:
+        with measure(metrics, "history"):
+            history.close()
+    except OSError as e:
+        logger.error(f"Failed to write history file: {str(e)}")
+
+    if progress is not None and total and not cancelled:
+        progress(total, total)
+
+
+def _lstat(path):
+    try:
+        return os.lstat(path)
+    except OSError:
+        return None
+
+
+def log_intents(chunk, history, metrics=None):
+    """Writes the intent records for the moves in a chunk before any of them start.
+
+    Each intent carries the identity of the source file, which costs one
+    lstat per move and lets recovery leave alone files it did not move.
+    """
+    with measure(metrics, "history"):
+        history.intend((entry.source, entry.destination, _lstat(entry.source))
+                       for entry in chunk if entry.action in ("move", "link"))
+
+
+def execute_plan(entries, history, total=None, progress=None, cancel=None, chunk_size=256,
+                 metrics=None, verify=False):
+    """Carries out planned moves, recording each one in the history journal.
+
+    progress, if given, is called as progress(done, total) before each entry,
+    and with a fractional done while a file is copied to another filesystem.
+    cancel is an optional threading.Event; once set, no further files are
+    moved and the moves made so far stay recorded for undo.  Intents are
+    logged chunk_size entries at a time, so the write-ahead log costs one
+    fsync per chunk rather than one per file.  metrics is an optional
+    Metrics collecting move and history timings.  With verify, copies to
+    another filesystem are checked against their source before it is
+    deleted.
+    """
+    moved_files = 0
+    skipped_files = 0
+    failed_files = 0
+    duplicate_files = 0
+    cancelled = False
+    done = 0
+    created_folders = set()
+    entries = iter(entries)
+    transfer = Transfer(verify)
+    if progress is not None and total:
+        # done already counts the file being copied
+        transfer.progress = lambda copied, size: progress(done - 1 + copied / size, total)
+
+    while not cancelled:
+        chunk = list(islice(entries, chunk_size))
+        if not chunk:
+            break
+        log_intents(chunk, history, metrics)
+
+        for entry in chunk:
+            if cancel is not None and cancel.is_set():
+                cancelled = True
+                break
+            if progress is not None:
+                progress(done, total)
+            done += 1
+
+            if entry.duplicate_of is not None:
+                duplicate_files += 1
+            if entry.action == "skip":
+                skipped_files += 1
+                continue
+            if entry.action == "clear":
+                clear_folder(entry.source)
+                created_folders.discard(entry.source)
+                continue
+
+            # Create category folder inside "Sorted/"
+            if not ensure_folder(os.path.dirname(entry.destination), created_folders):
+                failed_files += 1
+                continue
+
+            try:
+                entry = entry._replace(destination=carry_out(entry, metrics, transfer))
+                error = None
+            except Exception as e:
+                error = e
+
+            if record_move(entry, error, history, metrics):
+                moved_files += 1
+            else:
+                failed_files += 1
+
+    finish_run(history, total, progress, cancelled, metrics)
+    return OrganizeSummary(moved_files, skipped_files, failed_files, cancelled, duplicate_files)
+
+
+def execute_batched(entries, history, total=None, progress=None, cancel=None, batch_size=1024,
+                    metrics=None, verify=False):
+    """Carries out a whole plan folder by folder, for very large runs on a local disk.
+
+    The plan is read in full first.  Category folders to clear are removed,
+    then every destination folder is created in one pass, then the moves
+    are made grouped by destination folder (in plan order within each),
+    which keeps each folder's directory entries hot in cache.  Duplicate
+    links come last, once the files they point to are in place.  Intents
+    and history records are written batch_size moves at a time, and
+    progress is reported once per batch.  Moves run on the calling thread;
+    the summary, history and log match execute_plan, only the order of the
+    moves differs.
+    """
+    moved_files = 0
+    skipped_files = 0
+    failed_files = 0
+    duplicate_files = 0
+    clears = []
+    links = []
+    groups = {}
+    count = 0
+
+    for entry in entries:
+        count += 1
+        if entry.duplicate_of is not None:
+            duplicate_files += 1
+        if entry.action == "skip":
+            skipped_files += 1
+        elif entry.action == "clear":
+            clears.append(entry)
+        elif entry.action == "link":
+            links.append(entry)
+        else:
+            groups.setdefault(os.path.dirname(entry.destination), []).append(entry)
+    if total is None:
+        total = count
+    done = skipped_files + len(clears)
+
+    cancelled = cancel is not None and cancel.is_set()
+    work = []
+    if not cancelled:
+        for entry in clears:
+            clear_folder(entry.source)
+        failed_folders = prepare_folders(
+            set(groups).union(os.path.dirname(entry.destination) for entry in links), set())
+        for folder in failed_folders:
+            failed_files += len(groups.pop(folder, ()))
+        kept_links = [entry for entry in links
+                      if os.path.dirname(entry.destination) not in failed_folders]
+        failed_files += len(links) - len(kept_links)
+        done += failed_files
+        work = [entry for group in groups.values() for entry in group] + kept_links
+    transfer = Transfer(verify)
+
+    for start in range(0, len(work), batch_size):
+        if cancel is not None and cancel.is_set():
+            cancelled = True
+            break
+        if progress is not None:
+            progress(done, total)
+        batch = work[start:start + batch_size]
+        log_intents(batch, history, metrics)
+        for entry in batch:
+            if cancel is not None and cancel.is_set():
+                cancelled = True
+                break
+            done += 1
+            try:
+                entry = entry._replace(destination=carry_out(entry, metrics, transfer))
+                error = None
+            except Exception as e:
+                error = e
+            if record_move(entry, error, history, metrics):
+                moved_files += 1
+            else:
+                failed_files += 1
+        if cancelled:
+            break
+
+    finish_run(history, total, progress, cancelled, metrics)
+    return OrganizeSummary(moved_files, skipped_files, failed_files, cancelled, duplicate_files)
+
+
+class DeviceRouter:
+    """Looks up the (source device, destination device) pair of a move.
+
+    Device numbers are cached per directory, so a run stats each source and
+    destination folder once rather than once per file.
+    """
+
+    def __init__(self, per_device):
+        self.per_device = per_device
+        self._devices = {}
+        self._limits = {}
+
+    def device(self, folder):
+        dev = self._devices.get(folder)
+        if dev is None:
+            dev = os.stat(folder).st_dev
+            self._devices[folder] = dev
+        return dev
+
+    def route(self, entry):
+        """Returns None for a same-device move, else the semaphore for its device pair."""
+        pair = (self.device(os.path.dirname(entry.source)),
+                self.device(os.path.dirname(entry.destination)))
+        if pair[0] == pair[1]:
+            return None
+        limit = self._limits.get(pair)
+        if limit is None:
+            limit = threading.BoundedSemaphore(self.per_device)
+            self._limits[pair] = limit
+        return limit
+
+
+# Outcomes of entries that never reach the pool
+_SKIPPED = object()
+_CLEARED = object()
+_FAILED = object()
+
+
+def _limited_move(limit, entry, metrics, transfer):
+    with limit:
+        return carry_out(entry, metrics, transfer)
+
+
+def _inline_move(entry, metrics, transfer):
+    """Runs a move on the calling thread and wraps the outcome in a Future."""
+    future = Future()
+    try:
+        future.set_result(carry_out(entry, metrics, transfer))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def _wait_for(pending):
+    """Blocks until every move submitted so far in this chunk has finished."""
+    for _, earlier in pending:
+        if isinstance(earlier, Future):
+            earlier.exception()
+
+
+def execute_parallel(entries, history, total=None, progress=None, cancel=None,
+                     workers=4, per_device=None, chunk_size=256, metrics=None, verify=False):
+    """Carries out planned moves with a thread pool.
+
+    Same-device moves are plain renames and run inline; cross-device moves
+    (copy + delete) go to the pool, with at most per_device of them in
+    flight for each (source device, destination device) pair.  Entries are
+    processed in chunks and their results are logged and recorded in plan
+    order, so history and summary match a serial run exactly.  Progress
+    is reported per file only, since several copies run at once.
+    """
+    per_device = per_device or workers
+    router = DeviceRouter(per_device)
+    transfer = Transfer(verify)
+    moved_files = 0
+    skipped_files = 0
+    failed_files = 0
+    duplicate_files = 0
+    cancelled = False
+    done = 0
+    created_folders = set()
+    entries = iter(entries)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            if cancel is not None and cancel.is_set():
+                cancelled = True
+                break
+            chunk = list(islice(entries, chunk_size))
+            if not chunk:
+                break
+            log_intents(chunk, history, metrics)
+
+            pending = []
+            for entry in chunk:
+                if entry.duplicate_of is not None:
+                    duplicate_files += 1
+                if entry.action == "skip":
+                    pending.append((entry, _SKIPPED))
+                    continue
+                if entry.action == "clear":
+                    # Let moves already submitted from this chunk land first
+                    _wait_for(pending)
+                    clear_folder(entry.source)
+                    created_folders.discard(entry.source)
+                    pending.append((entry, _CLEARED))
+                    continue
+                if not ensure_folder(os.path.dirname(entry.destination), created_folders):
+                    pending.append((entry, _FAILED))
+                    continue
+                if entry.action == "link":
+                    # The copy being linked to may still be moving in this chunk
+                    _wait_for(pending)
+                    pending.append((entry, _inline_move(entry, metrics, transfer)))
+                    continue
+                try:
+                    limit = router.route(entry)
+                except OSError as e:
+                    future = Future()
+                    future.set_exception(e)
+                else:
+                    if limit is None:
+                        future = _inline_move(entry, metrics, transfer)
+                    else:
+                        future = pool.submit(_limited_move, limit, entry, metrics, transfer)
+                pending.append((entry, future))
+
+            for entry, future in pending:
+                if progress is not None:
+                    progress(done, total)
+                done += 1
+                if future is _SKIPPED:
+                    skipped_files += 1
+                elif future is _CLEARED:
+                    continue
+                elif future is _FAILED:
+                    failed_files += 1
+                else:
+                    error = future.exception()
+                    if error is None:
+                        entry = entry._replace(destination=future.result())
+                    if record_move(entry, error, history, metrics):
+                        moved_files += 1
+                    else:
+                        failed_files += 1
+
+    finish_run(history, total, progress, cancelled, metrics)
+    return OrganizeSummary(moved_files, skipped_files, failed_files, cancelled, duplicate_files)
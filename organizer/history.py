@@ -0,0 +1,477 @@
+"""Per-run undo history and write-ahead log for organize runs."""
+import os
+import json
+import time
+import logging
+from json.encoder import encode_basestring_ascii
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+from .models import InterruptedRun, OrganizeError, RunInfo
+
+logger = logging.getLogger(__name__)
+
+# Folder holding one JSON Lines journal per run plus an index of all runs
+HISTORY_DIR = os.path.join(os.path.expanduser("~"), ".file_organizer_history")
+
+# Single journal shared by all runs, written by earlier versions
+LEGACY_JOURNAL_FILE = os.path.join(os.path.expanduser("~"), "file_organizer_history.jsonl")
+
+# Single-dict history written by older versions, migrated on first use
+LEGACY_HISTORY_FILE = os.path.join(os.path.expanduser("~"), "file_organizer_history.json")
+
+INDEX_NAME = "index.jsonl"
+
+# Statuses after which a run has nothing left to undo; "empty" runs moved nothing
+_GONE = ("undone", "rolled_back", "empty")
+
+
+# Records of a finished move; "link" is a duplicate replaced by a hard link
+_MOVE_OPS = ("move", "link")
+
+# How every intent line written by _move_line starts
+_INTENT_PREFIX = b'{"op": "intent",'
+
+
+def _move_line(op, new_path, original_path, st=None):
+    """Returns the JSON line for an intent or move record, without building a dict.
+
+    Same text as json.dumps of {"op", "new", "original"}; the journal gets
+    two of these per file, so this is the hot path of a run's history.
+    With st (the lstat of the original), its device, inode, size and mtime
+    are added, so recovery can tell the run's own file from another one
+    that later took the same name.
+    """
+    line = (f'{{"op": "{op}", "new": {encode_basestring_ascii(new_path)}, '
+            f'"original": {encode_basestring_ascii(original_path)}')
+    if st is None:
+        return line + "}"
+    return (f'{line}, "dev": {st.st_dev}, "ino": {st.st_ino}, "size": {st.st_size}, '
+            f'"mtime": {st.st_mtime_ns}}}')
+
+
+def try_lock(fd):
+    """Takes an exclusive lock on an open file without waiting; returns False if it is held.
+
+    The lock goes away with the file descriptor, so a process that dies
+    releases it.
+    """
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def new_run_id():
+    """Returns a run ID that sorts by start time."""
+    return time.strftime("%Y%m%d-%H%M%S") + "-" + os.urandom(3).hex()
+
+
+def replace_atomically(tmp_path, path):
+    """Renames a fully written temp file over path and makes the rename durable."""
+    os.replace(tmp_path, path)
+    try:
+        dir_fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+    except OSError:
+        # Directories cannot be opened for fsync on every platform
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+
+def read_records(path):
+    """Streams the JSON object on each line of path, skipping torn lines."""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        for number, raw in enumerate(f, 1):
+            try:
+                record = json.loads(raw)
+            except ValueError:
+                record = None
+            if not isinstance(record, dict):
+                logger.warning(f"Skipping unreadable history entry at line {number} of {path}")
+                continue
+            yield record
+
+
+class HistoryJournal:
+    """Undo history kept as one append-only JSON Lines journal per run.
+
+    Every organize run gets a run ID, a journal file named after it and a
+    line in index.jsonl with its start time, folder and status, so listing
+    runs or undoing one of them never reads the journals of the others.
+
+    Within a run, an "intent" record per move is appended and fsynced
+    before a batch of moves starts; each finished move is then committed
+    with a "move" record ("link" for a duplicate replaced by a hard link to
+    the copy kept), and the run closes with an "end" record.  A run
+    without an end record was interrupted, and its intents without a
+    matching move record show which files may be half-moved (see
+    interrupted_runs).  Undoing appends an "undo" record per restored
+    file, so a cancelled undo picks up where it stopped without checking
+    every path on disk.
+
+    Records are buffered and appended in batches with one fsync per batch.
+    Files are only ever appended to or replaced whole via a temp file and
+    rename.
+    """
+
+    def __init__(self, path=HISTORY_DIR, batch_size=500, compact_every=50000):
+        self.path = path
+        self.batch_size = batch_size
+        self.compact_every = compact_every
+        self.run_id = None
+        self._pending = {}
+        self._queued = 0
+        self._appended = 0
+        self._moved = None
+        self._migrated = False
+        self._locks = {}
+
+    def run_path(self, run_id):
+        return os.path.join(self.path, run_id + ".jsonl")
+
+    def lock_path(self, run_id):
+        return os.path.join(self.path, run_id + ".lock")
+
+    def claim_run(self, run_id):
+        """Locks a run for this process until release_run; a no-op if already held.
+
+        While a run is locked, other processes do not report it as
+        interrupted.  Raises OrganizeError if another process holds it.
+        """
+        if run_id in self._locks:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        fd = os.open(self.lock_path(run_id), os.O_RDWR | os.O_CREAT, 0o600)
+        if not try_lock(fd):
+            os.close(fd)
+            raise OrganizeError(f"Run {run_id} is still in progress in another process.")
+        self._locks[run_id] = fd
+
+    def release_run(self, run_id):
+        """Unlocks a run claimed with claim_run."""
+        fd = self._locks.pop(run_id, None)
+        if fd is None:
+            return
+        try:
+            os.remove(self.lock_path(run_id))
+        except OSError:
+            pass
+        os.close(fd)
+
+    def is_live(self, run_id):
+        """Returns True if another process (or journal) holds the run's lock."""
+        if run_id in self._locks:
+            return True
+        try:
+            fd = os.open(self.lock_path(run_id), os.O_RDWR)
+        except OSError:
+            return False
+        try:
+            return not try_lock(fd)
+        finally:
+            os.close(fd)
+
+    @property
+    def index_path(self):
+        return os.path.join(self.path, INDEX_NAME)
+
+    def _append(self, record, run_id=None):
+        self._append_lines([json.dumps(record)], run_id)
+
+    def _append_lines(self, lines, run_id=None):
+        if not lines:
+            return
+        if run_id is None:
+            if self.run_id is None:
+                # Moves recorded outside begin_run still get a run of their own
+                self.begin_run(None)
+            run_id = self.run_id
+        self._pending.setdefault(run_id, []).extend(lines)
+        self._queued += len(lines)
+        if self._queued >= self.batch_size:
+            self.flush()
+
+    def _append_index(self, record):
+        os.makedirs(self.path, exist_ok=True)
+        with open(self.index_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def begin_run(self, directory, options=None):
+        """Starts a new run and returns its ID; the begin record is written at once."""
+        self.run_id = new_run_id()
+        self.claim_run(self.run_id)
+        started = time.time()
+        self._appended = 0
+        self._moved = 0
+        self._append({"op": "begin", "run": self.run_id, "started": started,
+                      "directory": directory, "options": options or {}})
+        self.flush()
+        self._append_index({"run": self.run_id, "started": started, "directory": directory,
+                            "status": "running"})
+        return self.run_id
+
+    def resume_run(self, run_id):
+        """Continues recording into an interrupted run.
+
+        Raises OrganizeError if another process is already working on it.
+        """
+        self.claim_run(run_id)
+        self.run_id = run_id
+        self._moved = None
+
+    def end_run(self, status="done"):
+        """Marks the current run as finished; status is "done" or "cancelled".
+
+        A run that moved nothing is forgotten instead, so it never becomes
+        the run that undo picks by default.
+        """
+        if self.run_id is None:
+            return
+        run_id = self.run_id
+        self._append({"op": "end", "run": run_id, "status": status})
+        self.flush()
+        self.run_id = None
+        if self._appended >= self.compact_every:
+            self.compact(run_id)
+        moves = self.count_moves(run_id) if self._moved is None else self._moved
+        self._appended = 0
+        if moves == 0:
+            self.forget_run(run_id, "empty")
+            return
+        self._append_index({"run": run_id, "status": status, "ended": time.time(),
+                            "moves": moves})
+        self.release_run(run_id)
+
+    def intend(self, moves):
+        """Logs (original_path, new_path, st) moves about to be made, durably.
+
+        st is the lstat result of original_path, or None if it is not
+        known.  Called once per batch before any of its moves start, so a
+        crash part way through always leaves a trace of the files in flight.
+        """
+        self._append_lines([_move_line("intent", new_path, original_path, st)
+                            for original_path, new_path, st in moves])
+        self.flush()
+
+    def record(self, original_path, new_path, run_id=None, linked=False):
+        """Commits one finished move; the batch is written once it is full.
+
+        run_id defaults to the current run.  linked marks a duplicate that
+        was replaced by a hard link, so undo gives it back data of its own.
+        """
+        self._append_lines([_move_line("link" if linked else "move", new_path, original_path)],
+                           run_id)
+        if run_id is None and self._moved is not None:
+            self._moved += 1
+
+    def record_undo(self, run_id, new_path):
+        """Notes that the file moved to new_path in run_id has been moved back."""
+        self._append({"op": "undo", "new": new_path}, run_id)
+
+    def flush(self):
+        """Appends queued records to their run journals and fsyncs once per file."""
+        if not self._pending:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        for run_id, lines in self._pending.items():
+            with open(self.run_path(run_id), "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._appended += len(lines)
+        self._pending = {}
+        self._queued = 0
+
+    def close(self):
+        """Flushes the last batch."""
+        self.flush()
+
+    def runs(self):
+        """Returns a RunInfo per run that still has moves to undo, newest first."""
+        self.migrate_legacy()
+        runs = {}
+        for record in read_records(self.index_path):
+            run_id = record.get("run")
+            if run_id is None:
+                continue
+            runs.setdefault(run_id, {}).update(record)
+        infos = [RunInfo(run_id, info.get("started"), info.get("directory"),
+                         info.get("status"), info.get("moves"))
+                 for run_id, info in runs.items() if info.get("status") not in _GONE]
+        infos.sort(key=lambda info: info.started or 0, reverse=True)
+        return infos
+
+    def run_records(self, run_id):
+        """Streams the records of one run."""
+        return read_records(self.run_path(run_id))
+
+    def count_moves(self, run_id):
+        return sum(1 for record in self.run_records(run_id) if record.get("op") in _MOVE_OPS)
+
+    def run_moves(self, run_id):
+        """Streams (new_path, original_path, linked) for the moves of a run not undone yet.
+
+        linked is True for a duplicate that was replaced by a hard link.
+        """
+        undone = {record.get("new") for record in self.run_records(run_id)
+                  if record.get("op") == "undo"}
+        for record in self.run_records(run_id):
+            op = record.get("op")
+            if op not in _MOVE_OPS or record.get("new") in undone:
+                continue
+            try:
+                yield record["new"], record["original"], op == "link"
+            except KeyError:
+                logger.warning(f"Skipping unreadable history entry in run {run_id}")
+
+    def interrupted_runs(self):
+        """Returns an InterruptedRun for every run that began but never ended.
+
+        Runs still going on in a live process (a watch session, or an
+        organize run in another window) hold a lock and are left out.
+        """
+        interrupted = []
+        for info in self.runs():
+            if info.status != "running" or self.is_live(info.run_id):
+                continue
+            begin = {}
+            committed = {}
+            pending = {}
+            for record in self.run_records(info.run_id):
+                op = record.get("op")
+                if op == "begin":
+                    begin = record
+                elif op == "intent":
+                    identity = None
+                    if "ino" in record:
+                        identity = (record["dev"], record["ino"], record["size"], record["mtime"])
+                    pending[record["new"]] = (record["original"], identity)
+                elif op in _MOVE_OPS:
+                    pending.pop(record["new"], None)
+                    committed[record["new"]] = record["original"]
+                elif op == "undo":
+                    # Restored by a rollback that was cancelled part way
+                    committed.pop(record["new"], None)
+            interrupted.append(InterruptedRun(
+                info.run_id, begin.get("directory", info.directory), begin.get("options", {}),
+                begin.get("started", info.started),
+                [(original, new) for new, original in committed.items()],
+                [(original, new, identity) for new, (original, identity) in pending.items()]))
+        return interrupted
+
+    def is_empty(self):
+        """Returns True when there is nothing to undo, including legacy history."""
+        return not self.runs()
+
+    def compact(self, run_id):
+        """Drops the intent records of a finished run, which are only needed for recovery."""
+        path = self.run_path(run_id)
+        tmp_path = path + ".tmp"
+        # Lines are copied as they are; intents are recognised by their prefix
+        # rather than parsed, since a run may have millions of them
+        with open(path, "rb") as src, open(tmp_path, "wb") as f:
+            for line in src:
+                if not line.startswith(_INTENT_PREFIX):
+                    f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        replace_atomically(tmp_path, path)
+
+    def forget_run(self, run_id, status="undone"):
+        """Removes a run that has been fully undone or rolled back, or moved nothing."""
+        self.flush()
+        self._append_index({"run": run_id, "status": status})
+        try:
+            os.remove(self.run_path(run_id))
+        except FileNotFoundError:
+            pass
+        self.release_run(run_id)
+        self.compact_index()
+
+    def compact_index(self):
+        """Rewrites the index without runs that are gone, once they make up most of it."""
+        lines = 0
+        live = {}
+        for record in read_records(self.index_path):
+            lines += 1
+            run_id = record.get("run")
+            if run_id is not None:
+                live.setdefault(run_id, {}).update(record)
+        live = {run_id: info for run_id, info in live.items() if info.get("status") not in _GONE}
+        if lines < 2 * len(live) + 100:
+            return
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for info in live.values():
+                f.write(json.dumps(info) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        replace_atomically(tmp_path, self.index_path)
+
+    def migrate_legacy(self, legacy_path=LEGACY_HISTORY_FILE, journal_path=LEGACY_JOURNAL_FILE):
+        """Imports history written by earlier versions as runs, then removes it.
+
+        The old single journal is split by its run IDs; moves recorded before
+        runs existed, and the old JSON dict, each become one run.
+        """
+        if self._migrated:
+            return
+        self._migrated = True
+        if os.path.exists(journal_path):
+            self._migrate_journal(journal_path)
+        if not os.path.exists(legacy_path):
+            return
+        try:
+            with open(legacy_path, "r") as f:
+                history = json.load(f)
+        except json.JSONDecodeError:
+            logger.error(f"Failed to read legacy history file {legacy_path}")
+            return
+        self._import_run("legacy-json", None, history.items())
+        os.remove(legacy_path)
+
+    def _migrate_journal(self, journal_path):
+        started = os.path.getmtime(journal_path)
+        runs = {}
+        for record in read_records(journal_path):
+            run_id = record.get("run") or "legacy-jsonl"
+            op = record.get("op", "move")
+            run = runs.setdefault(run_id, {"directory": None, "status": "done", "moves": []})
+            if op == "begin":
+                run["directory"] = record.get("directory")
+                run["started"] = record.get("started")
+            elif op == "move" and "new" in record and "original" in record:
+                run["moves"].append((record["new"], record["original"]))
+            elif op == "end" and record.get("status"):
+                run["status"] = record["status"]
+        for run_id, run in runs.items():
+            if run["moves"]:
+                self._import_run(run_id, run["directory"], run["moves"],
+                                 run.get("started", started), run["status"])
+        os.remove(journal_path)
+
+    def _import_run(self, run_id, directory, moves, started=None, status="done"):
+        for new_path, original_path in moves:
+            self._append({"op": "move", "new": new_path, "original": original_path}, run_id)
+        self.flush()
+        self._append_index({"run": run_id, "started": started or time.time(),
+                            "directory": directory, "status": status,
+                            "moves": self.count_moves(run_id)})
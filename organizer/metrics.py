@@ -0,0 +1,232 @@
+"""Counters, timing histograms and optional profiling for organize runs.
+
+Pass a Metrics instance to organize_directory, build_plan or run_plan to
+collect them; with metrics=None (the default) nothing is measured and the
+hot loops pay nothing.  Subclass Metrics and override count/observe to
+forward the numbers elsewhere.
+
+Phases:
+    scan      listing folders
+    classify  deciding each file's category
+    resolve   planning destinations, including name conflict resolution
+    move      carrying out one move (histogram per file)
+    history   writing history records
+"""
+import os
+import json
+import time
+import queue
+import atexit
+import logging
+import cProfile
+import threading
+import tracemalloc
+import logging.handlers
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+logger = logging.getLogger(__name__)
+
+PHASES = ("scan", "classify", "resolve", "move", "history")
+
+
+class Histogram:
+    """Timing histogram with power-of-two microsecond buckets."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+        self.buckets = Counter()
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.buckets[int(seconds * 1e6).bit_length()] += 1
+
+    def percentile(self, fraction):
+        """Returns the upper bound, in seconds, of the bucket holding that fraction of samples."""
+        wanted = fraction * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= wanted:
+                return min((1 << bucket) / 1e6, self.max)
+        return self.max
+
+    def snapshot(self):
+        if not self.count:
+            return {"count": 0, "total": 0.0}
+        return {"count": self.count, "total": self.total, "mean": self.total / self.count,
+                "min": self.min, "max": self.max, "p50": self.percentile(0.5),
+                "p90": self.percentile(0.9), "p99": self.percentile(0.99)}
+
+
+class Metrics:
+    """Collects counters and per-phase timings for one or more runs.
+
+    With profile, a cProfile profile of the thread that enters run() is
+    captured; with trace_memory, tracemalloc records peak memory and the
+    biggest allocation sites.  Counting and observing are thread-safe, so
+    pool workers can report moves directly.
+    """
+
+    def __init__(self, profile=False, trace_memory=False):
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.counters = Counter()
+        self.histograms = {}
+        self.elapsed = 0.0
+        self.profiler = None
+        self.memory = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def observe(self, phase, seconds):
+        with self._lock:
+            histogram = self.histograms.get(phase)
+            if histogram is None:
+                histogram = self.histograms[phase] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, phase):
+        """Times the enclosed block as one observation of phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(phase, time.perf_counter() - start)
+
+    def timed(self, iterable, phase):
+        """Yields from iterable, timing each step as one observation of phase.
+
+        Stages of the pipeline are chained generators, so time spent inside
+        an inner timed stage is subtracted: each phase gets only its own
+        share of the work.
+        """
+        local = self._local
+        iterator = iter(iterable)
+        while True:
+            outer = getattr(local, "inner", 0.0)
+            local.inner = 0.0
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                elapsed = time.perf_counter() - start
+                self.observe(phase, elapsed - local.inner)
+                local.inner = outer + elapsed
+                return
+            elapsed = time.perf_counter() - start
+            self.observe(phase, elapsed - local.inner)
+            local.inner = outer + elapsed
+            self.count(phase + ".items")
+            yield item
+
+    @contextmanager
+    def run(self):
+        """Measures wall time, and profiles if asked to, for the enclosed run."""
+        if self.profile:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.elapsed += time.perf_counter() - start
+            if self.profiler is not None:
+                self.profiler.disable()
+            if self.trace_memory and tracemalloc.is_tracing():
+                current, peak = tracemalloc.get_traced_memory()
+                top = tracemalloc.take_snapshot().statistics("lineno")[:10]
+                tracemalloc.stop()
+                self.memory = {"current": current, "peak": peak,
+                               "top": [{"where": str(stat.traceback), "size": stat.size,
+                                        "count": stat.count} for stat in top]}
+
+    def rates(self):
+        """Returns files and bytes moved per second of run time."""
+        if not self.elapsed:
+            return {"files_per_sec": None, "bytes_per_sec": None}
+        return {"files_per_sec": self.counters["files_moved"] / self.elapsed,
+                "bytes_per_sec": self.counters["bytes_moved"] / self.elapsed}
+
+    def snapshot(self):
+        """Returns everything collected so far as a JSON-friendly dict."""
+        with self._lock:
+            snapshot = {"elapsed": self.elapsed, "counters": dict(self.counters),
+                        "phases": {phase: histogram.snapshot()
+                                   for phase, histogram in self.histograms.items()},
+                        "rates": self.rates()}
+        if self.memory is not None:
+            snapshot["memory"] = self.memory
+        return snapshot
+
+    def save(self, path):
+        """Writes the snapshot as JSON."""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp_path, path)
+
+    def save_profile(self, path):
+        """Writes the cProfile stats, readable with pstats or snakeviz."""
+        if self.profiler is not None:
+            self.profiler.dump_stats(path)
+
+    def log_summary(self):
+        rates = self.rates()
+        logger.info(f"Run took {self.elapsed:.3f}s: {self.counters['files_moved']} files, "
+                    f"{rates['files_per_sec'] or 0:.0f} files/s, "
+                    f"{(rates['bytes_per_sec'] or 0) / 1e6:.1f} MB/s")
+        for phase in PHASES:
+            histogram = self.histograms.get(phase)
+            if histogram is not None and histogram.count:
+                logger.info(f"  {phase}: {histogram.total:.3f}s over {histogram.count} steps, "
+                            f"p99 {histogram.percentile(0.99) * 1e3:.2f}ms")
+
+
+def timed(iterable, metrics, phase):
+    """Returns iterable, timed as phase when metrics is given."""
+    if metrics is None:
+        return iterable
+    return metrics.timed(iterable, phase)
+
+
+def measure(metrics, phase):
+    """Returns a context manager timing a block as phase when metrics is given."""
+    if metrics is None:
+        return nullcontext()
+    return metrics.timer(phase)
+
+
+def queue_logging(filename, level=logging.INFO, fmt="%(asctime)s - %(message)s"):
+    """Sends log records through a queue to a file handler on a background thread.
+
+    The thread that moves files only enqueues records; the file writes
+    happen on the listener thread, which is stopped (and drained) at exit.
+    Returns the QueueListener.
+    """
+    handler = logging.FileHandler(filename, encoding="utf-8")
+    handler.setFormatter(logging.Formatter(fmt))
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+
+    root = logging.getLogger()
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
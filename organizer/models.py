@@ -0,0 +1,34 @@
+"""Plain data types shared by the planner, executors and front ends."""
+from collections import namedtuple
+
+# One step of a plan.  action is one of:
+#   "move"  - move source to destination
+#   "skip"  - leave source where it is (destination is None)
+#   "clear" - remove the category folder at source (destination is None)
+#   "link"  - replace a duplicate: hard-link duplicate_of at destination, remove source
+# duplicate_of is the identical file a duplicate was matched against, if any.
+PlanEntry = namedtuple("PlanEntry", "action source destination category duplicate_of",
+                       defaults=(None,))
+
+# Result counts of an organize run; cancelled is True if it was stopped early and
+# duplicates counts files handled by dedup (they are also counted as moved or skipped)
+OrganizeSummary = namedtuple("OrganizeSummary", "moved skipped failed cancelled duplicates",
+                             defaults=(False, 0))
+
+# Result counts of an undo run; cancelled is True if it was stopped early
+UndoSummary = namedtuple("UndoSummary", "restored failed cancelled", defaults=(False,))
+
+# One run in the undo history.  status is "running" (or interrupted), "done" or
+# "cancelled"; moves is the number of files it moved, None while it is running.
+RunInfo = namedtuple("RunInfo", "run_id started directory status moves")
+
+# A run that began but never ended.  options are the settings it was started
+# with, committed the (original, new) moves it finished and pending the
+# (original, new, identity) moves that were logged as intended but never
+# confirmed; identity is the original's (dev, ino, size, mtime_ns) when it
+# was logged, or None for journals written by older versions.
+InterruptedRun = namedtuple("InterruptedRun", "run_id directory options started committed pending")
+
+
+class OrganizeError(Exception):
+    """Raised when a directory cannot be organized at all."""
@@ -0,0 +1,134 @@
+"""Collision-free destination names.
+
+NameAllocator hands out "name_N.ext" variants from an in-memory index of a
+folder, so allocating a name never probes the disk.  move_without_overwrite
+makes the final move itself no-clobber, which keeps runs safe when another
+process writes to the same folder between planning and moving.
+"""
+import os
+import re
+import errno
+
+from .categories import EXTENSION_INDEX
+from .scan import list_names
+from .transfer import Transfer
+
+# Matches the "_N" counter that get appended to a stem
+_SUFFIX_RE = re.compile(r"^(.*)_(\d+)$")
+
+
+class NameAllocator:
+    """Allocates unique names in one folder in O(1) per name.
+
+    taken is the set of names already present; allocated names are added to
+    it.  For each (stem, extension) the allocator remembers the next unused
+    counter, so thousands of "scan.pdf" files do not rescan scan_1 … scan_N.
+    """
+
+    def __init__(self, taken, index=EXTENSION_INDEX):
+        self.taken = taken
+        self.index = index
+        self._next = {}
+        for name in taken:
+            self._note(name)
+
+    def _note(self, name):
+        stem, ext = self.index.split(name)
+        match = _SUFFIX_RE.match(stem)
+        if match:
+            key = (match.group(1), ext)
+            counter = int(match.group(2))
+            if counter >= self._next.get(key, 1):
+                self._next[key] = counter + 1
+
+    def allocate(self, filename):
+        """Returns filename, or the next free "stem_N.ext" if it is taken, and reserves it."""
+        if filename not in self.taken:
+            self.taken.add(filename)
+            self._note(filename)
+            return filename
+
+        stem, ext = self.index.split(filename)
+        counter = self._next.get((stem, ext), 1)
+        new_filename = f"{stem}_{counter}{ext}"
+        while new_filename in self.taken:
+            counter += 1
+            new_filename = f"{stem}_{counter}{ext}"
+
+        self._next[(stem, ext)] = counter + 1
+        self.taken.add(new_filename)
+        return new_filename
+
+
+def move_exclusive(source, destination, transfer=None, copy=False):
+    """Moves source to destination, raising FileExistsError instead of overwriting.
+
+    A cross-device move is copied by transfer (a plain Transfer if None);
+    anything else stays a rename.  With copy, the data is copied even on
+    the same device, so destination never shares an inode with source.
+    """
+    if not copy:
+        try:
+            # A hard link fails atomically if the name exists, which makes
+            # the same-device case a no-clobber rename
+            os.link(source, destination, follow_symlinks=False)
+        except FileExistsError:
+            raise
+        except OSError:
+            # Cross-device or no hard-link support (FAT, exFAT, some network
+            # shares): reserve the name below, then rename over it
+            pass
+        else:
+            try:
+                os.unlink(source)
+            except BaseException:
+                os.unlink(destination)
+                raise
+            return
+
+    fd = os.open(destination, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+    os.close(fd)
+    try:
+        if copy:
+            (transfer or Transfer()).move(source, destination)
+        else:
+            try:
+                os.replace(source, destination)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                (transfer or Transfer()).move(source, destination)
+    except BaseException:
+        try:
+            os.remove(destination)
+        except OSError:
+            pass
+        raise
+
+
+def move_without_overwrite(source, destination, transfer=None):
+    """Moves source to destination, picking a new free name if it was taken meanwhile.
+
+    Returns the path the file actually ended up at.
+    """
+    while True:
+        try:
+            move_exclusive(source, destination, transfer)
+            return destination
+        except FileExistsError:
+            folder, filename = os.path.split(destination)
+            destination = os.path.join(folder, NameAllocator(list_names(folder)).allocate(filename))
+
+
+def link_without_overwrite(target, destination):
+    """Creates a hard link to target at destination, picking a new name if it is taken.
+
+    Returns the path of the new link.
+    """
+    while True:
+        try:
+            os.link(target, destination, follow_symlinks=False)
+            return destination
+        except FileExistsError:
+            folder, filename = os.path.split(destination)
+            destination = os.path.join(folder, NameAllocator(list_names(folder)).allocate(filename))
@@ -0,0 +1,62 @@
+"""Plan files: a saved organize plan that can be reviewed and applied later.
+
+A plan file is JSON Lines.  The first line is a header describing the run;
+every following line is one PlanEntry.  Both writing and reading stream, so
+plans for millions of files never have to fit in memory.
+"""
+import os
+import json
+import time
+from collections import Counter
+
+from .models import OrganizeError, PlanEntry
+
+PLAN_VERSION = 1
+
+
+def write_plan(path, entries, directory):
+    """Streams entries into a plan file and returns a Counter of actions.
+
+    The file is written to a temporary name and renamed into place, so an
+    interrupted write never leaves a truncated plan behind.
+    """
+    counts = Counter()
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        header = {"version": PLAN_VERSION, "directory": directory, "created": time.time()}
+        f.write(json.dumps(header) + "\n")
+        for entry in entries:
+            f.write(json.dumps(entry._asdict()) + "\n")
+            counts[entry.action] += 1
+    os.replace(tmp_path, path)
+    return counts
+
+
+def read_plan_header(path):
+    """Returns the header dict of a plan file."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+    except (OSError, ValueError) as e:
+        raise OrganizeError(f"Failed to read plan file {path}: {e}")
+    if header.get("version") != PLAN_VERSION:
+        raise OrganizeError(f"Unsupported plan file version in {path}")
+    return header
+
+
+def read_plan(path):
+    """Streams the PlanEntry tuples stored in a plan file."""
+    read_plan_header(path)
+    with open(path, "r", encoding="utf-8") as f:
+        f.readline()
+        for line_number, line in enumerate(f, 2):
+            try:
+                yield PlanEntry(**json.loads(line))
+            except (ValueError, TypeError) as e:
+                raise OrganizeError(f"Invalid entry on line {line_number} of {path}: {e}")
+
+
+def count_plan_entries(path):
+    """Returns the number of entries in a plan file without parsing them."""
+    with open(path, "rb") as f:
+        return max(sum(1 for _ in f) - 1, 0)
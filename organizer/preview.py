@@ -0,0 +1,240 @@
+"""A compact, sortable and filterable copy of a plan for front ends to display.
+
+PlanPreview keeps one entry per row in parallel columns: folder and
+category names are stored once and referred to by number, sizes and
+statuses live in arrays.  Sorting and filtering only rebuild an array of
+row numbers, so a view over hundreds of thousands of planned moves stays
+cheap to hold and quick to reorder.
+"""
+import os
+from array import array
+from collections import Counter
+
+# What happens to a file, as shown to the user:
+#   "move"      - moved under its own name
+#   "renamed"   - moved under a new name because the name was taken
+#   "duplicate" - identical to a file already kept (linked, skipped or quarantined)
+#   "skip"      - left where it is
+#   "clear"     - a category folder that will be removed first
+STATUSES = ("move", "renamed", "duplicate", "skip", "clear")
+
+_MOVE, _RENAMED, _DUPLICATE, _SKIP, _CLEAR = range(len(STATUSES))
+
+# Columns that rows can be sorted by, in display order
+COLUMNS = ("name", "category", "size", "status", "destination")
+
+# Size of a row whose file could not be stat'ed
+UNKNOWN_SIZE = -1
+
+
+def format_size(size):
+    """Returns a size in bytes as a short human-readable string."""
+    if size < 0:
+        return "?"
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def _ranks(values):
+    """Returns, for each index into values, its position in case-insensitive sorted order."""
+    ranks = [0] * len(values)
+    for rank, code in enumerate(sorted(range(len(values)), key=lambda code: values[code].lower())):
+        ranks[code] = rank
+    return ranks
+
+
+class PlanPreview:
+    """Planned moves held column by column, with a sorted and filtered row order.
+
+    Load it with load(); after that, rows is the current display order
+    (row numbers into the columns) and row(position) returns what to show
+    at a position in it.  select() rebuilds rows for a sort column and
+    filters; with no arguments, all rows are shown in plan order.
+    """
+
+    def __init__(self):
+        self._folders = []
+        self._folder_ids = {}
+        self._categories = []
+        self._category_ids = {}
+        self.source_folder = array("I")
+        self.destination_folder = array("I")
+        self.names = []
+        # New name of a renamed file, None where it keeps its name
+        self.new_names = []
+        self.category = array("I")
+        self.size = array("q")
+        self.status = bytearray()
+        self.counts = Counter()
+        self.rows = array("I")
+        self.cancelled = False
+
+    def _intern(self, value, ids, values):
+        code = ids.get(value)
+        if code is None:
+            code = ids[value] = len(values)
+            values.append(value)
+        return code
+
+    def add(self, entry, size=UNKNOWN_SIZE):
+        """Appends one PlanEntry; it is not visible until select() is called."""
+        self.load([entry], stat=False, sizes=[size], show=False)
+
+    def load(self, entries, total=None, progress=None, cancel=None, stat=True, sizes=None,
+             show=True):
+        """Adds every entry from a plan and shows them all; returns self.
+
+        With stat, each file is lstat'ed for its size; sizes, if given,
+        yields the sizes instead.  progress is called as progress(done,
+        total) every 1000 entries; if cancel is set part way, what was
+        loaded so far is kept and cancelled is set.
+        """
+        split = os.path.split
+        lstat = os.lstat
+        folder_ids, folders = self._folder_ids, self._folders
+        category_ids, categories = self._category_ids, self._categories
+        source_folder, destination_folder = self.source_folder, self.destination_folder
+        names, new_names = self.names, self.new_names
+        category_codes, size_column, status_column = self.category, self.size, self.status
+        counts = [0] * len(STATUSES)
+        sizes = iter(sizes) if sizes is not None else None
+        no_folder = self._intern("", folder_ids, folders)
+
+        for done, entry in enumerate(entries):
+            if done % 1000 == 0:
+                if cancel is not None and cancel.is_set():
+                    self.cancelled = True
+                    break
+                if progress is not None:
+                    progress(done, total)
+
+            folder, name = split(entry.source)
+            code = folder_ids.get(folder)
+            if code is None:
+                code = self._intern(folder, folder_ids, folders)
+            source_folder.append(code)
+            names.append(name)
+
+            new_name = None
+            if entry.destination is None:
+                destination_folder.append(no_folder)
+            else:
+                folder, new_name = split(entry.destination)
+                code = folder_ids.get(folder)
+                if code is None:
+                    code = self._intern(folder, folder_ids, folders)
+                destination_folder.append(code)
+                if new_name == name:
+                    new_name = None
+            new_names.append(new_name)
+
+            category = entry.category or ""
+            code = category_ids.get(category)
+            if code is None:
+                code = self._intern(category, category_ids, categories)
+            category_codes.append(code)
+
+            if entry.action == "clear":
+                status = _CLEAR
+            elif entry.duplicate_of is not None:
+                status = _DUPLICATE
+            elif entry.action == "skip":
+                status = _SKIP
+            elif new_name is not None:
+                status = _RENAMED
+            else:
+                status = _MOVE
+            status_column.append(status)
+            counts[status] += 1
+
+            size = UNKNOWN_SIZE
+            if sizes is not None:
+                size = next(sizes)
+            elif stat and status != _CLEAR:
+                try:
+                    size = lstat(entry.source).st_size
+                except OSError:
+                    pass
+            size_column.append(size)
+
+        for status, count in zip(STATUSES, counts):
+            if count:
+                self.counts[status] += count
+        if show:
+            self.select()
+        return self
+
+    def __len__(self):
+        return len(self.names)
+
+    def categories(self):
+        """Returns the categories present in the plan, sorted."""
+        return sorted(category for category in self._categories if category)
+
+    def source(self, row):
+        return os.path.join(self._folders[self.source_folder[row]], self.names[row])
+
+    def destination(self, row):
+        """Returns where row's file will end up, or None if it is not moved."""
+        folder = self._folders[self.destination_folder[row]]
+        if not folder:
+            return None
+        return os.path.join(folder, self.new_names[row] or self.names[row])
+
+    def row(self, position):
+        """Returns (name, category, size, status, destination) for a display position."""
+        row = self.rows[position]
+        return (self.names[row], self._categories[self.category[row]], self.size[row],
+                STATUSES[self.status[row]], self.destination(row))
+
+    def select(self, sort_by=None, descending=False, category=None, status=None,
+               min_size=None, max_size=None):
+        """Rebuilds rows: keeps the rows matching every filter given, ordered by sort_by.
+
+        sort_by is one of COLUMNS, or None for plan order.  Sorting is stable,
+        so rows that tie stay in plan order.
+        """
+        rows = range(len(self.names))
+        if category is not None:
+            code = self._category_ids.get(category)
+            codes = self.category
+            rows = [row for row in rows if codes[row] == code]
+        if status is not None:
+            code = STATUSES.index(status)
+            statuses = self.status
+            rows = [row for row in rows if statuses[row] == code]
+        if min_size is not None or max_size is not None:
+            sizes = self.size
+            low = 0 if min_size is None else min_size
+            high = float("inf") if max_size is None else max_size
+            rows = [row for row in rows if low <= sizes[row] < high]
+
+        key = self._sort_key(sort_by)
+        if key is not None:
+            rows = sorted(rows, key=key, reverse=descending)
+        elif descending:
+            rows = reversed(rows)
+        self.rows = array("I", rows)
+        return len(self.rows)
+
+    def _sort_key(self, sort_by):
+        if sort_by is None:
+            return None
+        if sort_by == "name":
+            names = self.names
+            return lambda row: names[row].lower()
+        if sort_by == "category":
+            ranks = _ranks(self._categories)
+            codes = self.category
+            return lambda row: ranks[codes[row]]
+        if sort_by == "size":
+            return self.size.__getitem__
+        if sort_by == "status":
+            return self.status.__getitem__
+        if sort_by == "destination":
+            ranks = _ranks(self._folders)
+            folders, names, new_names = self.destination_folder, self.names, self.new_names
+            return lambda row: (ranks[folders[row]], (new_names[row] or names[row]).lower())
+        raise ValueError(f"Unknown sort column: {sort_by}")
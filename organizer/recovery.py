@@ -0,0 +1,180 @@
+"""Finishing or rolling back organize runs that were interrupted part way."""
+import os
+import stat
+import logging
+
+from .dedup import Deduplicator
+from .engine import organize_directory, run_plan
+from .executor import execute_restore
+from .history import HistoryJournal
+from .models import OrganizeSummary, UndoSummary
+from .planfile import read_plan
+from .rules import RuleSet
+from .sniff import ContentSniffer
+from .transfer import partial_path
+
+logger = logging.getLogger(__name__)
+
+
+def find_interrupted_runs(history=None):
+    """Returns the runs in the history that began but never ended."""
+    if history is None:
+        history = HistoryJournal()
+    return history.interrupted_runs()
+
+
+# FAT and exFAT round timestamps down to as much as 2 seconds
+_TIMESTAMP_SLACK = 2
+
+
+def _lstat(path):
+    try:
+        return os.lstat(path)
+    except OSError:
+        return None
+
+
+def _is_moved_copy(st, identity):
+    """Returns True if st is the file the intent was logged for, after its move.
+
+    A rename or hard link keeps the inode, a copy to another filesystem
+    lands on another device; both keep size and modification time, which
+    also guards against the inode number having been reused.
+    """
+    if identity is None:
+        return False
+    dev, ino, size, mtime = identity
+    if st.st_size != size or st.st_mtime_ns != mtime:
+        return False
+    return st.st_dev != dev or st.st_ino == ino
+
+
+def settle_pending(run):
+    """Works out what happened to the moves a run logged but never confirmed.
+
+    Intents record the planned name and the identity of the source, but the
+    name may have been taken by an unrelated file since (a concurrent
+    writer, or a plan applied after it was written), so nothing is trusted
+    by name alone:
+
+    - source gone, destination is the logged file: the move finished before
+      the crash and is returned as an (original, new) pair;
+    - both exist and the destination is a hard link to the source, or an
+      empty file created after the run started (the name a move reserves
+      before renaming or copying over it, on any device): the move never
+      completed, the leftover is removed and the source stays;
+    - anything else is logged and both files are left as they are.
+
+    Side files of interrupted cross-device copies are removed too.
+    """
+    finished = []
+    for original_path, new_path, identity in run.pending:
+        partial = partial_path(new_path)
+        if os.path.lexists(partial):
+            try:
+                os.unlink(partial)
+                logger.info(f"Removed incomplete copy: {partial}")
+            except OSError as e:
+                logger.error(f"Failed to remove incomplete copy {partial}: {str(e)}")
+
+        source = _lstat(original_path)
+        destination = _lstat(new_path)
+        if destination is None:
+            if source is None:
+                logger.warning(f"Cannot find {original_path} or {new_path} after interrupted run")
+            continue
+
+        if source is None:
+            if _is_moved_copy(destination, identity):
+                finished.append((original_path, new_path))
+            else:
+                logger.warning(f"{original_path} is gone and {new_path} is not the file that was "
+                               f"moved; leaving it alone")
+            continue
+
+        leftover = os.path.samestat(source, destination) or (
+            stat.S_ISREG(destination.st_mode) and destination.st_size == 0
+            and destination.st_mtime >= (run.started or 0) - _TIMESTAMP_SLACK)
+        if not leftover:
+            logger.warning(f"{new_path} exists but was not written by run {run.run_id}; "
+                           f"leaving it and {original_path} alone")
+            continue
+        try:
+            os.unlink(new_path)
+            logger.info(f"Removed incomplete move: {new_path}")
+        except OSError as e:
+            logger.error(f"Failed to remove incomplete move {new_path}: {str(e)}")
+    return finished
+
+
+def resume_run(run, history=None, progress=None, cancel=None, workers=1, per_device=None):
+    """Finishes an interrupted run under its original run ID.
+
+    Moves that completed before the crash are committed, then the rest of
+    the work is redone with the run's original settings: a saved plan is
+    applied again for the entries whose source is still there, and an
+    organize run is planned afresh, which picks up exactly the files that
+    were not moved yet.  Category folders are never cleared on resume.
+    Raises OrganizeError if another process is already working on the run.
+    """
+    if history is None:
+        history = HistoryJournal()
+    history.resume_run(run.run_id)
+
+    finished = settle_pending(run)
+    for original_path, new_path in finished:
+        history.record(original_path, new_path)
+    history.flush()
+
+    options = run.options
+    if options.get("plan"):
+        entries = (entry for entry in read_plan(options["plan"])
+                   if entry.action != "clear" and os.path.lexists(entry.source))
+        summary = run_plan(entries, None, history, progress, cancel, workers, per_device,
+                           verify=options.get("verify", False))
+    elif run.directory and os.path.isdir(run.directory):
+        sniffer = ContentSniffer(options["sniff"]) if options.get("sniff") else None
+        deduplicator = Deduplicator(options["dedup"]) if options.get("dedup") else None
+        rules = RuleSet.load(options["rules"]) if options.get("rules") else None
+        summary = organize_directory(run.directory, True, history, progress, cancel,
+                                     workers, per_device, options.get("recursive", False),
+                                     options.get("max_depth"), options.get("include"),
+                                     options.get("exclude"), sniffer, deduplicator,
+                                     rules=rules, verify=options.get("verify", False))
+    else:
+        summary = OrganizeSummary(0, 0, 0)
+
+    history.end_run("cancelled" if summary.cancelled else "done")
+    return summary._replace(moved=summary.moved + len(finished))
+
+
+def rollback_run(run, history=None, progress=None, cancel=None, workers=1):
+    """Moves every file of an interrupted run back and removes the run from history.
+
+    progress is called as progress(done, total).  If cancel is set part way,
+    the files already restored are marked as undone and the run stays
+    open, so the rollback can be started again later.  Raises OrganizeError
+    if another process is already working on the run.
+    """
+    if history is None:
+        history = HistoryJournal()
+    history.claim_run(run.run_id)
+    try:
+        finished = settle_pending(run)
+        for original_path, new_path in finished:
+            history.record(original_path, new_path, run.run_id)
+        history.flush()
+
+        total = len(run.committed) + len(finished)
+        restored, failed, cancelled = execute_restore(history.run_moves(run.run_id), history,
+                                                      run.run_id, total, progress, cancel,
+                                                      workers)
+        if not cancelled:
+            try:
+                history.forget_run(run.run_id, "rolled_back")
+            except OSError as e:
+                logger.error(f"Failed to update history file: {str(e)}")
+    finally:
+        history.release_run(run.run_id)
+    logger.info(f"Rolled back run {run.run_id}: restored {restored}, failed {failed}")
+    return UndoSummary(restored, failed, cancelled)
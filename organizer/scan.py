@@ -0,0 +1,132 @@
+"""Directory scanning built on os.scandir.
+
+scandir returns file type information with each entry, so listing a folder
+costs one getdents-style call instead of a stat per file.  SortedIndex
+takes one listing of every Sorted/<Category> folder up front, which lets
+the planner answer "is this name already sorted?" and "is this name free?"
+from memory.
+"""
+import os
+import logging
+from fnmatch import fnmatch
+
+from .categories import all_categories
+
+logger = logging.getLogger(__name__)
+
+
+def scan_directory(directory):
+    """Yields a DirEntry for each visible regular file directly inside directory."""
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.name.startswith('.'):  # Skip hidden files
+                continue
+            try:
+                if entry.is_file():
+                    yield entry
+            except OSError:
+                continue
+
+
+def _matches(rel_path, name, patterns):
+    return any(fnmatch(rel_path, p) or fnmatch(name, p) for p in patterns)
+
+
+def walk_files(root, max_depth=None, include=None, exclude=None, skip_dirs=(), state=None):
+    """Lazily yields paths, relative to root, of visible regular files in the tree.
+
+    The walk is depth first and keeps one open scandir iterator per level,
+    so memory grows with the depth of the tree, not its size.  Symlinked
+    directories are not followed and folders in skip_dirs (absolute paths)
+    are not entered.  max_depth=0 means root only.  include/exclude are glob
+    patterns matched against the relative path and the bare name; exclude
+    also prunes whole directories.  With an IncrementalState, unchanged
+    folders are not listed again and unchanged files are not yielded.
+    """
+    root = os.path.abspath(root)
+    skip_dirs = {os.path.abspath(d) for d in skip_dirs}
+    open_dir = os.scandir if state is None else state.open_dir
+    stack = [(open_dir(root), "", 0, root)]
+
+    try:
+        while stack:
+            it, prefix, depth, folder = stack[-1]
+            entry = next(it, None)
+            if entry is None:
+                it.close()
+                stack.pop()
+                continue
+
+            name = entry.name
+            if name.startswith('.'):  # Skip hidden files and folders
+                continue
+            rel_path = prefix + name
+
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if state is not None:
+                        state.note_subdir(folder, name)
+                    if max_depth is not None and depth >= max_depth:
+                        continue
+                    if entry.path in skip_dirs or (exclude and _matches(rel_path, name, exclude)):
+                        continue
+                    try:
+                        stack.append((open_dir(entry.path), rel_path + os.sep, depth + 1, entry.path))
+                    except PermissionError:
+                        logger.error(f"Permission denied when accessing {entry.path}")
+                    continue
+                if not entry.is_file():
+                    continue
+            except OSError:
+                continue
+
+            if exclude and _matches(rel_path, name, exclude):
+                continue
+            if include and not _matches(rel_path, name, include):
+                continue
+            if state is not None and not state.should_process(rel_path, entry):
+                continue
+            yield rel_path
+    finally:
+        for it, _, _, _ in stack:
+            it.close()
+
+
+def list_names(folder):
+    """Returns the set of entry names in folder, or an empty set if it is missing."""
+    try:
+        with os.scandir(folder) as it:
+            return {entry.name for entry in it}
+    except FileNotFoundError:
+        return set()
+    except PermissionError:
+        logger.error(f"Permission denied when accessing {folder}")
+        return set()
+
+
+class SortedIndex:
+    """In-memory listing of every category folder inside a Sorted directory."""
+
+    def __init__(self, sorted_folder, empty=False, categories=None):
+        # empty=True plans against category folders that will be cleared first;
+        # categories lists the folders to index (by default the built-in ones)
+        self.sorted_folder = sorted_folder
+        self._folders = {}
+        self._sorted_names = set()
+        for category in all_categories() if categories is None else categories:
+            folder = os.path.join(sorted_folder, category)
+            names = set() if empty else list_names(folder)
+            self._folders[folder] = names
+            self._sorted_names.update(names)
+
+    def is_sorted(self, filename):
+        """Returns True if a file with this name is in any category folder."""
+        return filename in self._sorted_names
+
+    def names(self, folder):
+        """Returns the live set of names taken in folder; add to it to reserve a name."""
+        names = self._folders.get(folder)
+        if names is None:
+            names = list_names(folder)
+            self._folders[folder] = names
+        return names
@@ -0,0 +1,213 @@
+"""Content-based classification for files with a missing or wrong extension.
+
+Only the first SNIFF_BYTES of a file are read and compared against a table
+of magic signatures.  Results are cached on disk keyed by (device, inode,
+mtime, size), so unchanged files are never read twice across runs.
+"""
+import os
+import re
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from .categories import OTHERS_CATEGORY, classify
+
+logger = logging.getLogger(__name__)
+
+# How much of each file is read; enough for the tar header at offset 257
+SNIFF_BYTES = 512
+
+# Persistent sniff results, next to the undo history
+SNIFF_CACHE_FILE = os.path.join(os.path.expanduser("~"), "file_organizer_sniff_cache.json")
+
+# (pattern, category), matched at the start of the file in order; more
+# specific patterns come first.  "." matches any byte.
+MAGIC_SIGNATURES = [
+    (rb"\xff\xd8\xff", "Images"),                          # JPEG
+    (rb"\x89PNG\r\n\x1a\n", "Images"),                     # PNG
+    (rb"GIF8[79]a", "Images"),
+    (rb"RIFF.{4}WEBP", "Images"),
+    (rb"BM.{4}\x00\x00\x00\x00", "Images"),                # BMP, reserved bytes are zero
+    (rb"(<\?xml[^>]*>\s*)?<svg", "Images"),
+    (rb"RIFF.{4}AVI ", "Videos"),
+    (rb"\x1a\x45\xdf\xa3", "Videos"),                      # Matroska / WebM
+    (rb"FLV\x01", "Videos"),
+    (rb"\x30\x26\xb2\x75\x8e\x66\xcf\x11", "Videos"),      # ASF / WMV
+    (rb".{4}ftypM4A", "Music"),                            # AAC in an MP4 container
+    (rb".{4}ftyp(heic|heix|heim|heis|hevc|hevx|mif1|msf1|avif|avis)", "Images"),  # HEIF / AVIF
+    (rb".{4}ftyp", "Videos"),                              # MP4 / MOV
+    (rb"RIFF.{4}WAVE", "Music"),
+    (rb"ID3", "Music"),                                    # MP3 with ID3 tag
+    (rb"\xff[\xfb\xf3\xf2]", "Music"),                     # MP3 frame
+    (rb"\xff\xf1", "Music"),                               # ADTS AAC
+    (rb"fLaC", "Music"),
+    (rb"OggS", "Music"),
+    (rb"%PDF-", "Documents"),
+    (rb"PK\x03\x04.{26}\[Content_Types\]\.xml", "Documents"),  # docx / xlsx / pptx
+    (rb"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "Documents"),   # doc / xls (OLE2)
+    (rb"PK\x03\x04", "Archives"),                          # any other ZIP
+    (rb"Rar!\x1a\x07", "Archives"),
+    (rb"7z\xbc\xaf\x27\x1c", "Archives"),
+    (rb"\x1f\x8b\x08", "Archives"),                        # gzip
+    (rb"BZh[1-9]", "Archives"),
+    (rb"\xfd7zXZ\x00", "Archives"),
+    (rb".{257}ustar", "Archives"),                         # tar
+    (rb"MZ", "Executables"),                               # Windows PE
+    (rb"\x7fELF", "Executables"),
+    (rb"#!/", "Executables"),                              # scripts with a shebang
+    (rb"(?i)\s*<!DOCTYPE html", "Code"),
+    (rb"(?i)\s*<html", "Code"),
+]
+
+# Signatures of two or three bytes, which ordinary text can start with by
+# chance: they classify a file with an unknown extension but never override
+# a known one
+WEAK_SIGNATURES = {rb"BM.{4}\x00\x00\x00\x00", rb"ID3", rb"\xff[\xfb\xf3\xf2]", rb"\xff\xf1",
+                   rb"MZ", rb"#!/"}
+
+_COMPILED_SIGNATURES = [(re.compile(pattern, re.DOTALL), category, pattern in WEAK_SIGNATURES)
+                        for pattern, category in MAGIC_SIGNATURES]
+
+# Part of every cache key; bumped when the table changes what a file sniffs as
+_CACHE_VERSION = 2
+
+
+def match_signature(head):
+    """Returns (category, weak) for the first signature matching head, or (None, False)."""
+    for pattern, category, weak in _COMPILED_SIGNATURES:
+        if pattern.match(head):
+            return category, weak
+    return None, False
+
+
+def sniff_bytes(head, strong_only=False):
+    """Returns the category whose signature matches head, or None.
+
+    With strong_only, a match on one of the WEAK_SIGNATURES counts as none.
+    """
+    category, weak = match_signature(head)
+    return None if weak and strong_only else category
+
+
+class SniffCache:
+    """Sniff results keyed by (device, inode, mtime_ns, size), stored as JSON.
+
+    An empty string records "no signature matched" so those files are not
+    read again either, and a leading "?" marks a match on a weak signature.
+    Only the newest max_entries results are kept.
+    """
+
+    def __init__(self, path=SNIFF_CACHE_FILE, max_entries=500000):
+        self.path = path
+        self.max_entries = max_entries
+        self._entries = None
+        self._dirty = False
+
+    @staticmethod
+    def key(st):
+        return f"{_CACHE_VERSION}:{st.st_dev}:{st.st_ino}:{st.st_mtime_ns}:{st.st_size}"
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except FileNotFoundError:
+                self._entries = {}
+            except (OSError, ValueError):
+                logger.warning(f"Ignoring unreadable sniff cache {self.path}")
+                self._entries = {}
+        return self._entries
+
+    def get(self, key):
+        return self._load().get(key)
+
+    def put(self, key, category):
+        self._load()[key] = category
+        self._dirty = True
+
+    def save(self):
+        """Writes the cache atomically if anything changed."""
+        if not self._dirty:
+            return
+        entries = self._entries
+        if len(entries) > self.max_entries:
+            keep = list(entries.items())[-self.max_entries:]
+            entries = self._entries = dict(keep)
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        except OSError as e:
+            logger.error(f"Failed to write sniff cache: {str(e)}")
+
+
+class ContentSniffer:
+    """Classifies files by extension, falling back to their first bytes.
+
+    mode "unknown" sniffs only files whose extension maps to Others; mode
+    "all" sniffs every file and lets a matching signature override the
+    extension, which also catches mislabeled files.  Only a strong
+    signature overrides a known extension (see WEAK_SIGNATURES).  Files are sniffed in
+    batches on a thread pool.
+    """
+
+    def __init__(self, mode="unknown", workers=8, batch_size=256, cache=None):
+        if mode not in ("unknown", "all"):
+            raise ValueError(f"Unknown sniff mode: {mode}")
+        self.mode = mode
+        self.workers = workers
+        self.batch_size = batch_size
+        self.cache = SniffCache() if cache is None else cache
+
+    def sniff(self, path, strong_only=False):
+        """Returns the content category of path, or None if unknown or unreadable.
+
+        With strong_only, a match on a weak signature counts as unknown.
+        """
+        try:
+            with open(path, "rb") as f:
+                st = os.fstat(f.fileno())
+                key = SniffCache.key(st)
+                cached = self.cache.get(key)
+                if cached is None:
+                    category, weak = match_signature(f.read(SNIFF_BYTES))
+                    cached = ("?" if weak else "") + (category or "")
+                    self.cache.put(key, cached)
+        except OSError:
+            return None
+        if cached.startswith("?"):
+            return None if strong_only else cached[1:]
+        return cached or None
+
+    def classify(self, directory, files, classifier=None):
+        """Yields (rel_path, category) for paths relative to directory.
+
+        classifier(directory, rel_path) gives the category before sniffing
+        (by default the extension lookup); files it leaves in Others, or
+        every file in "all" mode, are sniffed.
+        """
+        files = iter(files)
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                while True:
+                    batch = list(islice(files, self.batch_size))
+                    if not batch:
+                        break
+                    if classifier is None:
+                        categories = [classify(os.path.basename(f)) for f in batch]
+                    else:
+                        categories = [classifier(directory, f) for f in batch]
+                    todo = [i for i, category in enumerate(categories)
+                            if self.mode == "all" or category == OTHERS_CATEGORY]
+                    paths = [os.path.join(directory, batch[i]) for i in todo]
+                    strong_only = [categories[i] != OTHERS_CATEGORY for i in todo]
+                    for i, category in zip(todo, pool.map(self.sniff, paths, strong_only)):
+                        if category is not None:
+                            categories[i] = category
+                    yield from zip(batch, categories)
+        finally:
+            self.cache.save()
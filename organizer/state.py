@@ -0,0 +1,189 @@
+"""Persistent incremental state, so re-runs only look at new or changed files.
+
+The state lives in a SQLite database next to the undo history.  For every
+folder it records the folder's mtime and its subfolders: a folder whose
+mtime has not changed has had no entries added, removed or renamed, so the
+walk does not list it again and only visits its known subfolders.  The
+mtime is the one read before the folder was listed, so a file that arrives
+while a run is going still changes it.  For files the plan left in place
+(skipped, or duplicates kept where they are) it records (size, mtime,
+inode) so they are not classified again; files whose move failed are not
+recorded, and their folder is listed again, so the move is retried.
+
+State is kept per scope (root folder plus the options that decide which
+files are picked up), so a run with different options starts fresh.
+"""
+import os
+import json
+import sqlite3
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Database with the incremental state, next to the undo history
+STATE_FILE = os.path.join(os.path.expanduser("~"), "file_organizer_state.sqlite3")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    scope TEXT NOT NULL,
+    path TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    subdirs TEXT NOT NULL,
+    PRIMARY KEY (scope, path)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS files (
+    scope TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    PRIMARY KEY (scope, path)
+) WITHOUT ROWID;
+"""
+
+
+def make_scope(root, *options):
+    """Returns a short key identifying a root folder and the options of a run."""
+    raw = json.dumps([os.path.abspath(root)] + [repr(o) for o in options])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def open_state(root, *options, path=STATE_FILE):
+    """Returns the IncrementalState for root under the given run options."""
+    return IncrementalState(root, make_scope(root, *options), path)
+
+
+class _KnownDir:
+    """Stands in for a DirEntry of a subfolder remembered from a previous run."""
+
+    def __init__(self, parent, name):
+        self.name = name
+        self.path = os.path.join(parent, name)
+
+    def is_dir(self, follow_symlinks=True):
+        return True
+
+    def is_file(self, follow_symlinks=True):
+        return False
+
+
+class _KnownDirs:
+    """Iterator over remembered subfolders with the close() of a scandir iterator."""
+
+    def __init__(self, parent, names):
+        self._entries = iter([_KnownDir(parent, name) for name in names])
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._entries)
+
+    def close(self):
+        pass
+
+
+class IncrementalState:
+    """Tracks which folders and files of one scope have already been handled.
+
+    The walk asks open_dir() for each folder and should_process() for each
+    file; the plan goes through track(), and commit() saves what was seen
+    once a run has finished.
+    """
+
+    def __init__(self, root, scope, path=STATE_FILE):
+        self.root = os.path.abspath(root)
+        self.scope = scope
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.executescript(_SCHEMA)
+        self._visited = {}
+        self._seen_files = []
+        self._kept = set()
+
+    def open_dir(self, path):
+        """Returns an iterator of entries for path.
+
+        An unchanged folder yields only its remembered subfolders; any other
+        folder is listed with os.scandir and remembered for commit().
+        """
+        row = self._db.execute("SELECT mtime_ns, subdirs FROM dirs WHERE scope = ? AND path = ?",
+                               (self.scope, path)).fetchone()
+        mtime = os.stat(path).st_mtime_ns
+        if row is not None and mtime == row[0]:
+            return _KnownDirs(path, json.loads(row[1]))
+        it = os.scandir(path)
+        self._visited[path] = (mtime, [])
+        return it
+
+    def note_subdir(self, parent, name):
+        """Records a subfolder seen while listing a changed folder."""
+        visited = self._visited.get(parent)
+        if visited is not None:
+            visited[1].append(name)
+
+    def should_process(self, rel_path, entry):
+        """Returns False for a file left unchanged since the last run."""
+        try:
+            st = entry.stat()
+        except OSError:
+            return True
+        row = self._db.execute("SELECT size, mtime_ns, ino FROM files WHERE scope = ? AND path = ?",
+                               (self.scope, rel_path)).fetchone()
+        if row == (st.st_size, st.st_mtime_ns, st.st_ino):
+            return False
+        self._seen_files.append(rel_path)
+        return True
+
+    def track(self, entries):
+        """Passes plan entries through, noting the files they leave in place."""
+        for entry in entries:
+            if entry.action == "skip":
+                self._kept.add(os.path.relpath(entry.source, self.root))
+            yield entry
+
+    def commit(self):
+        """Saves the folders listed and files seen in this run.
+
+        Folders keep the mtime read when they were listed, so anything that
+        changed them during the run gets them listed again next time.
+        Files the plan left in place are remembered; every other file seen
+        is forgotten, and a folder that still holds one (its move failed)
+        is not saved, so the file is tried again.
+        """
+        files = []
+        gone_files = []
+        retry_dirs = set()
+        for rel_path in self._seen_files:
+            path = os.path.join(self.root, rel_path)
+            if rel_path in self._kept:
+                try:
+                    st = os.stat(path)
+                    files.append((self.scope, rel_path, st.st_size, st.st_mtime_ns, st.st_ino))
+                    continue
+                except FileNotFoundError:
+                    pass
+            elif os.path.lexists(path):
+                retry_dirs.add(os.path.dirname(path))
+            gone_files.append((self.scope, rel_path))
+
+        dirs = []
+        gone_dirs = []
+        for path, (mtime, subdirs) in self._visited.items():
+            if path in retry_dirs or not os.path.isdir(path):
+                gone_dirs.append((self.scope, path))
+            else:
+                dirs.append((self.scope, path, mtime, json.dumps(subdirs)))
+
+        with self._db:
+            self._db.executemany("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?)", dirs)
+            self._db.executemany("DELETE FROM dirs WHERE scope = ? AND path = ?", gone_dirs)
+            self._db.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)", files)
+            self._db.executemany("DELETE FROM files WHERE scope = ? AND path = ?", gone_files)
+        self._visited = {}
+        self._seen_files = []
+        self._kept = set()
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,185 @@
+"""Moving files across filesystems.
+
+A rename cannot cross a mount point, so a move to another filesystem is a
+copy followed by a delete.  Transfer does the copy with the kernel's
+zero-copy paths where they exist (copy_file_range, then sendfile) and a
+large buffer otherwise, preallocates the destination, keeps permissions
+and timestamps, and syncs the copy to disk before the source is removed.
+With verify, both files are hashed first and the source is kept if they
+differ.
+"""
+import os
+import stat
+import errno
+import shutil
+import hashlib
+import logging
+
+from .dedup import full_hash
+
+logger = logging.getLogger(__name__)
+
+# Bytes per copy_file_range/sendfile call or buffered read
+BUFFER_SIZE = 8 * 1024 * 1024
+
+# Keeps Windows from translating line endings in os.open'd files
+_BINARY = getattr(os, "O_BINARY", 0)
+
+# Errors meaning "this copy method does not work for these two files"
+_UNSUPPORTED = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTSUP,
+                errno.EPERM, errno.EBADF}
+
+
+def partial_path(destination):
+    """Returns the hidden side file a copy to destination is written to.
+
+    Its name has a fixed length, so it fits wherever the destination's does.
+    """
+    folder, name = os.path.split(destination)
+    digest = hashlib.sha1(os.fsencode(name)).hexdigest()[:16]
+    return os.path.join(folder, f".organizer-{digest}.part")
+
+
+class VerificationError(OSError):
+    """Raised when a copy does not match its source; the source is left in place."""
+
+
+def preallocate(fd, size):
+    """Reserves size bytes for the destination up front, so it is laid out in one piece."""
+    if size and hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+        except OSError:
+            pass
+
+
+def _copy_file_range(fin, fout, buffer_size, report):
+    copied = 0
+    while True:
+        n = os.copy_file_range(fin, fout, buffer_size)
+        if not n:
+            return copied
+        copied += n
+        report(copied)
+
+
+def _sendfile(fin, fout, buffer_size, report):
+    copied = 0
+    while True:
+        n = os.sendfile(fout, fin, copied, buffer_size)
+        if not n:
+            return copied
+        copied += n
+        report(copied)
+
+
+def _buffered(fin, fout, buffer_size, report):
+    copied = 0
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    while True:
+        n = os.readv(fin, [buffer])
+        if not n:
+            return copied
+        written = 0
+        while written < n:
+            written += os.write(fout, view[written:n])
+        copied += n
+        report(copied)
+
+
+class Transfer:
+    """Copies files to another filesystem and removes the originals.
+
+    progress, if given, is called as progress(copied, size) after each
+    buffer_size block of a file, so a single large file can move a
+    progress bar too.  A copy method that the kernel refuses for a pair of
+    filesystems is given up for the rest of the run and the next one is
+    tried, down to plain buffered reads and writes.
+    """
+
+    def __init__(self, verify=False, buffer_size=BUFFER_SIZE, progress=None):
+        self.verify = verify
+        self.buffer_size = buffer_size
+        self.progress = progress
+        self._methods = []
+        if hasattr(os, "copy_file_range"):
+            self._methods.append(_copy_file_range)
+        if hasattr(os, "sendfile"):
+            self._methods.append(_sendfile)
+        if hasattr(os, "readv"):
+            self._methods.append(_buffered)
+
+    def copy_contents(self, fin, fout, size):
+        """Copies everything from fin to fout, both at offset 0; returns the bytes copied."""
+        progress = self.progress
+        if progress is not None and size:
+            def report(copied):
+                progress(min(copied, size), size)
+        else:
+            def report(copied):
+                pass
+
+        for method in list(self._methods):
+            try:
+                return method(fin, fout, self.buffer_size, report)
+            except OSError as e:
+                # Only fall back if nothing was written yet
+                if e.errno not in _UNSUPPORTED or os.lseek(fout, 0, os.SEEK_CUR) != 0:
+                    raise
+                if method is not _buffered:
+                    # Pool threads share the transfer; swap the list rather than mutate it
+                    self._methods = [m for m in self._methods if m is not method]
+                    logger.debug(f"{method.__name__.lstrip('_')} unavailable, falling back: {str(e)}")
+        with open(fin, "rb", buffering=self.buffer_size, closefd=False) as src:
+            with open(fout, "wb", buffering=0, closefd=False) as dst:
+                shutil.copyfileobj(src, dst, self.buffer_size)
+                copied = dst.tell()
+        report(copied)
+        return copied
+
+    def move(self, source, destination):
+        """Moves source to destination, a name already reserved on another filesystem.
+
+        On any error the source is untouched and the partial copy removed;
+        the caller removes the reserved name.
+        """
+        st = os.lstat(source)
+        if not stat.S_ISREG(st.st_mode):
+            # Symlinks and special files: let shutil recreate them
+            os.unlink(destination)
+            shutil.move(source, destination)
+            return
+
+        # The data goes to a side file that replaces the reserved name only
+        # once complete, so an interrupted copy never looks like a finished one
+        partial = partial_path(destination)
+        try:
+            fin = os.open(source, os.O_RDONLY | _BINARY)
+            try:
+                fout = os.open(partial, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | _BINARY, 0o600)
+                try:
+                    size = os.fstat(fin).st_size
+                    preallocate(fout, size)
+                    copied = self.copy_contents(fin, fout, size)
+                    if copied != size:
+                        # The source changed size while copying; drop preallocated space
+                        os.ftruncate(fout, copied)
+                    os.fsync(fout)
+                finally:
+                    os.close(fout)
+            finally:
+                os.close(fin)
+
+            shutil.copystat(source, partial)
+            if self.verify and full_hash(source) != full_hash(partial):
+                raise VerificationError(errno.EIO, f"Copy of {source} does not match the original",
+                                        destination)
+            os.replace(partial, destination)
+        except BaseException:
+            try:
+                os.remove(partial)
+            except OSError:
+                pass
+            raise
+        os.unlink(source)
@@ -0,0 +1,279 @@
+"""Watch mode: keep a folder organized as files arrive.
+
+Filesystem events come from inotify on Linux (through ctypes, no extra
+dependency) or from a polling scan elsewhere.  New files are only moved
+once their size and mtime have stopped changing for a short settle time,
+so downloads and copies in progress are left alone.  Ready files go through
+the usual classify → plan → execute pipeline in small batches.
+"""
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+from fnmatch import fnmatch
+
+from .engine import SORTED_FOLDER_NAME, classify_files, plan_moves
+from .executor import execute_plan
+from .history import HistoryJournal
+from .scan import SortedIndex, walk_files
+
+logger = logging.getLogger(__name__)
+
+# Files that browsers and copy tools use while a transfer is still running
+DEFAULT_IGNORE = ["*.part", "*.crdownload", "*.download", "*.tmp", "*.partial", "~*"]
+
+# inotify constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class InotifySource:
+    """Reports paths touched in a folder (and optionally its subfolders) via inotify."""
+
+    def __init__(self, directory, recursive=False, skip_dirs=()):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._libc = libc
+        self.directory = directory
+        self.recursive = recursive
+        self.skip_dirs = set(skip_dirs)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._watches = {}
+        self.overflowed = False
+        self._add_watch(directory, "")
+        if recursive:
+            for root, dirs, _ in os.walk(directory):
+                dirs[:] = [d for d in dirs if not d.startswith('.') and
+                           os.path.join(root, d) not in self.skip_dirs]
+                for d in dirs:
+                    path = os.path.join(root, d)
+                    self._add_watch(path, os.path.relpath(path, directory) + os.sep)
+
+    def _add_watch(self, path, prefix):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), _WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            logger.error(f"Cannot watch {path}: {os.strerror(err)}")
+            return
+        self._watches[wd] = prefix
+
+    def wait(self, timeout):
+        """Waits up to timeout seconds and returns the relative paths touched."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return []
+            raise
+
+        touched = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped; the watcher rescans to catch up
+                self.overflowed = True
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            prefix = self._watches.get(wd)
+            if prefix is None or not name or name.startswith('.'):
+                continue
+            rel_path = prefix + name
+            if mask & IN_ISDIR:
+                path = os.path.join(self.directory, rel_path)
+                if self.recursive and path not in self.skip_dirs:
+                    self._add_watch(path, rel_path + os.sep)
+                    # Files may have landed before the watch existed
+                    touched.extend(rel_path + os.sep + f for f in walk_files(path))
+                continue
+            touched.append(rel_path)
+        return touched
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingSource:
+    """Fallback source that rescans the folder and reports new or changed files."""
+
+    def __init__(self, directory, recursive=False, skip_dirs=(), interval=1.0):
+        self.directory = directory
+        self.max_depth = None if recursive else 0
+        self.skip_dirs = list(skip_dirs)
+        self.interval = interval
+        self.overflowed = False
+        self._last_scan = 0.0
+        self._snapshot = {}
+
+    def wait(self, timeout):
+        delay = self._last_scan + self.interval - time.monotonic()
+        if delay > 0:
+            time.sleep(min(delay, timeout))
+            if delay > timeout:
+                return []
+        self._last_scan = time.monotonic()
+
+        touched = []
+        snapshot = {}
+        for rel_path in walk_files(self.directory, self.max_depth, skip_dirs=self.skip_dirs):
+            try:
+                st = os.stat(os.path.join(self.directory, rel_path))
+            except OSError:
+                continue
+            key = (st.st_size, st.st_mtime_ns)
+            snapshot[rel_path] = key
+            if self._snapshot.get(rel_path) != key:
+                touched.append(rel_path)
+        self._snapshot = snapshot
+        return touched
+
+    def close(self):
+        pass
+
+
+class Debouncer:
+    """Holds touched files until their size and mtime stay unchanged for settle seconds."""
+
+    def __init__(self, directory, settle=0.5):
+        self.directory = directory
+        self.settle = settle
+        self._pending = {}
+
+    def touch(self, rel_path, now):
+        previous = self._pending.get(rel_path)
+        self._pending[rel_path] = (previous[0] if previous else None, now)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def ready(self, now):
+        """Returns files that have settled and forgets them."""
+        ready = []
+        for rel_path, (key, changed_at) in list(self._pending.items()):
+            try:
+                st = os.stat(os.path.join(self.directory, rel_path))
+            except OSError:
+                del self._pending[rel_path]
+                continue
+            current = (st.st_size, st.st_mtime_ns)
+            if current != key:
+                self._pending[rel_path] = (current, now)
+            elif now - changed_at >= self.settle:
+                del self._pending[rel_path]
+                ready.append(rel_path)
+        return ready
+
+
+class Watcher:
+    """Keeps directory organized until cancel (a threading.Event) is set.
+
+    Files that match an ignore pattern are left alone.  Unlike a one-off
+    run, a file whose name is already in a category folder is renamed
+    rather than skipped, so the watched folder keeps draining.  The whole
+    session is recorded as one run in the history.
+    """
+
+    def __init__(self, directory, history=None, recursive=False, settle=0.5, tick=0.1,
+                 ignore=None, sniffer=None, poll=False, poll_interval=1.0, rules=None):
+        self.directory = os.path.abspath(directory)
+        self.sorted_folder = os.path.join(self.directory, SORTED_FOLDER_NAME)
+        self.history = HistoryJournal() if history is None else history
+        self.recursive = recursive
+        self.settle = settle
+        self.tick = tick
+        self.ignore = DEFAULT_IGNORE if ignore is None else ignore
+        self.sniffer = sniffer
+        self.poll = poll
+        self.poll_interval = poll_interval
+        self.rules = rules
+
+    def _open_source(self):
+        skip_dirs = [self.sorted_folder]
+        if not self.poll and sys.platform.startswith("linux"):
+            try:
+                return InotifySource(self.directory, self.recursive, skip_dirs)
+            except (OSError, AttributeError) as e:
+                logger.warning(f"inotify unavailable, falling back to polling: {str(e)}")
+        return PollingSource(self.directory, self.recursive, skip_dirs, self.poll_interval)
+
+    def _wanted(self, rel_path):
+        name = os.path.basename(rel_path)
+        return not any(fnmatch(name, pattern) for pattern in self.ignore)
+
+    def _existing_files(self):
+        return walk_files(self.directory, None if self.recursive else 0,
+                          skip_dirs=[self.sorted_folder])
+
+    def process(self, ready, index):
+        """Classifies, plans and moves one micro-batch of settled files."""
+        classified = classify_files(self.directory, ready, self.sniffer, self.rules)
+        entries = plan_moves(self.directory, classified, index, skip_sorted_names=False)
+        summary = execute_plan(entries, self.history, len(ready))
+        logger.info(f"Watch batch: moved {summary.moved}, skipped {summary.skipped}, "
+                    f"failed {summary.failed}")
+        return summary
+
+    def run(self, cancel=None, on_batch=None):
+        """Watches until cancel is set; on_batch(summary) is called after each batch."""
+        os.makedirs(self.sorted_folder, exist_ok=True)
+        index = SortedIndex(self.sorted_folder, categories=self.rules and self.rules.folders())
+        debouncer = Debouncer(self.directory, self.settle)
+        source = self._open_source()
+        logger.info(f"Watching {self.directory} using {type(source).__name__}")
+
+        now = time.monotonic()
+        for rel_path in self._existing_files():
+            if self._wanted(rel_path):
+                debouncer.touch(rel_path, now)
+
+        self.history.begin_run(self.directory, {"recursive": self.recursive,
+                                                "sniff": self.sniffer and self.sniffer.mode,
+                                                "rules": self.rules and self.rules.path})
+        try:
+            while cancel is None or not cancel.is_set():
+                touched = source.wait(self.tick)
+                now = time.monotonic()
+                if source.overflowed:
+                    source.overflowed = False
+                    touched = list(self._existing_files())
+                for rel_path in touched:
+                    if self._wanted(rel_path):
+                        debouncer.touch(rel_path, now)
+
+                if len(debouncer):
+                    ready = debouncer.ready(now)
+                    if ready:
+                        summary = self.process(ready, index)
+                        if on_batch is not None:
+                            on_batch(summary)
+        finally:
+            source.close()
+            self.history.close()
+            self.history.end_run()
@@ -0,0 +1,102 @@
+"""Duplicate detection and what undo does with the duplicates it replaced."""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from organizer import dedup
+from organizer.dedup import PARTIAL_BLOCK, Deduplicator
+from organizer.engine import organize_directory, undo_history
+from organizer.history import HistoryJournal
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+class FindTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.directory = os.path.join(self.root, "incoming")
+        self.sorted_folder = os.path.join(self.directory, "Sorted")
+        os.makedirs(self.sorted_folder)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def write(self, rel_path, content):
+        path = os.path.join(self.directory, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(content)
+        return rel_path
+
+    def find(self, *names):
+        _, duplicates = Deduplicator(workers=2, processes=1).find(
+            self.directory, self.sorted_folder, [(name, "Documents") for name in names])
+        return duplicates
+
+    def test_empty_files_are_not_duplicates(self):
+        names = [self.write(f"e{i}.txt", b"") for i in range(3)]
+        self.write(os.path.join("Sorted", "Documents", "kept.txt"), b"")
+        self.assertEqual(self.find(*names), {})
+
+    def test_unique_sizes_are_never_read(self):
+        names = [self.write("a.txt", b"a"), self.write("bb.txt", b"bb"),
+                 self.write("c.txt", b"c")]
+        with mock.patch.object(dedup, "partial_hash", wraps=dedup.partial_hash) as partial:
+            duplicates = self.find(*names)
+        self.assertEqual(sorted(call.args[0] for call in partial.call_args_list),
+                         [os.path.join(self.directory, "a.txt"),
+                          os.path.join(self.directory, "c.txt")])
+        self.assertEqual(duplicates, {})
+
+    def test_sorted_copy_is_kept(self):
+        self.write(os.path.join("Sorted", "Documents", "a.txt"), b"same")
+        kept = os.path.join(self.sorted_folder, "Documents", "a.txt")
+        names = [self.write("a.txt", b"same"), self.write("b.txt", b"same")]
+        self.assertEqual(self.find(*names), {"a.txt": kept, "b.txt": kept})
+
+    def test_large_files_that_differ_in_the_middle(self):
+        head, tail = b"h" * PARTIAL_BLOCK, b"t" * PARTIAL_BLOCK
+        names = [self.write("a.bin", head + b"1" * 1000 + tail),
+                 self.write("b.bin", head + b"2" * 1000 + tail),
+                 self.write("c.bin", head + b"1" * 1000 + tail)]
+        self.assertEqual(self.find(*names), {"c.bin": os.path.join(self.directory, "a.bin")})
+
+
+class HardlinkUndoTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.directory = os.path.join(self.root, "incoming")
+        os.makedirs(self.directory)
+        self.history = HistoryJournal(os.path.join(self.root, "history"))
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_undo_gives_duplicates_back_their_own_data(self):
+        paths = [os.path.join(self.directory, f"s{i}.txt") for i in (1, 2, 3)]
+        for path in paths:
+            write(path, "same")
+        summary = organize_directory(self.directory, history=self.history,
+                                     deduplicator=Deduplicator("hardlink"))
+        self.assertEqual(summary.duplicates, 2)
+
+        self.assertEqual(undo_history(self.history).restored, 3)
+        inodes = {os.stat(path).st_ino for path in paths}
+        self.assertEqual(len(inodes), 3)
+        write(paths[0], "changed")
+        self.assertEqual([read(path) for path in paths], ["changed", "same", "same"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+"""The undo history: which runs it keeps and which one undo picks."""
+import os
+import shutil
+import tempfile
+import unittest
+
+from organizer.engine import organize_directory, undo_history
+from organizer.history import HistoryJournal
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+class HistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.directory = os.path.join(self.root, "incoming")
+        os.makedirs(self.directory)
+        self.history = HistoryJournal(os.path.join(self.root, "history"))
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_run_that_moved_nothing_is_not_kept(self):
+        write(os.path.join(self.directory, "a.pdf"), "a")
+        self.assertEqual(organize_directory(self.directory, history=self.history).moved, 1)
+        first = self.history.runs()[0].run_id
+
+        # The only file left has a name that is already sorted
+        write(os.path.join(self.directory, "a.pdf"), "again")
+        summary = organize_directory(self.directory, history=self.history)
+        self.assertEqual((summary.moved, summary.skipped), (0, 1))
+
+        self.assertEqual([info.run_id for info in self.history.runs()], [first])
+        self.assertEqual(sorted(os.listdir(self.history.path)),
+                         sorted(["index.jsonl", f"{first}.jsonl"]))
+        os.remove(os.path.join(self.directory, "a.pdf"))
+        self.assertEqual(undo_history(self.history).restored, 1)
+
+    def test_chunk_without_moves_writes_nothing(self):
+        self.history.begin_run(self.directory)
+        path = self.history.run_path(self.history.run_id)
+        with open(path, "rb") as f:
+            before = f.read()
+        self.history.intend([])
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), before)
+        self.history.end_run()
+
+    def test_undo_does_not_overwrite_a_new_file(self):
+        original = os.path.join(self.directory, "a.pdf")
+        write(original, "a")
+        organize_directory(self.directory, history=self.history)
+        write(original, "new")
+
+        summary = undo_history(self.history)
+        self.assertEqual((summary.restored, summary.failed), (0, 1))
+        with open(original) as f:
+            self.assertEqual(f.read(), "new")
+        with open(os.path.join(self.directory, "Sorted", "Documents", "a.pdf")) as f:
+            self.assertEqual(f.read(), "a")
+
+
+if __name__ == "__main__":
+    unittest.main()
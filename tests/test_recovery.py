@@ -0,0 +1,146 @@
+"""Crash and recovery of organize runs: what an interrupted run may and may not touch."""
+import os
+import shutil
+import tempfile
+import unittest
+
+from organizer.executor import log_intents
+from organizer.history import HistoryJournal
+from organizer.models import InterruptedRun, PlanEntry
+from organizer.recovery import resume_run, rollback_run, settle_pending
+from organizer.transfer import partial_path
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+class CrashRecoveryTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.directory = os.path.join(self.root, "incoming")
+        self.documents = os.path.join(self.directory, "Sorted", "Documents")
+        os.makedirs(self.documents)
+        self.history_dir = os.path.join(self.root, "history")
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def start_run(self, names):
+        """Begins a run and logs intents to move names into Sorted/Documents."""
+        history = HistoryJournal(self.history_dir)
+        history.begin_run(self.directory)
+        entries = [PlanEntry("move", os.path.join(self.directory, name),
+                             os.path.join(self.documents, name), "Documents")
+                   for name in names]
+        log_intents(entries, history)
+        return history, entries
+
+    def crash(self, history):
+        """Drops the journal without ending the run, as a killed process would."""
+        history.flush()
+        history.release_run(history.run_id)
+
+    def interrupted(self):
+        runs = HistoryJournal(self.history_dir).interrupted_runs()
+        self.assertEqual(len(runs), 1)
+        return runs[0]
+
+    def test_rollback_keeps_unrelated_file_at_planned_name(self):
+        write(os.path.join(self.directory, "a.pdf"), "a")
+        write(os.path.join(self.directory, "b.pdf"), "b")
+        history, entries = self.start_run(["a.pdf", "b.pdf"])
+        # a.pdf was linked into place when the process died; b.pdf's
+        # planned name was then taken by someone else's file
+        os.link(entries[0].source, entries[0].destination)
+        write(entries[1].destination, "not ours")
+        self.crash(history)
+
+        rollback_run(self.interrupted(), HistoryJournal(self.history_dir))
+
+        self.assertEqual(read(entries[0].source), "a")
+        self.assertFalse(os.path.exists(entries[0].destination))
+        self.assertEqual(read(entries[1].source), "b")
+        self.assertEqual(read(entries[1].destination), "not ours")
+
+    def test_unrelated_file_is_not_committed_when_source_is_gone(self):
+        write(os.path.join(self.directory, "a.pdf"), "a")
+        history, entries = self.start_run(["a.pdf"])
+        os.remove(entries[0].source)
+        write(entries[0].destination, "not ours")
+        self.crash(history)
+
+        run = self.interrupted()
+        self.assertEqual(settle_pending(run), [])
+        rollback_run(run, HistoryJournal(self.history_dir))
+
+        self.assertFalse(os.path.exists(entries[0].source))
+        self.assertEqual(read(entries[0].destination), "not ours")
+
+    def test_finished_move_is_committed_and_rolled_back(self):
+        write(os.path.join(self.directory, "a.pdf"), "a")
+        history, entries = self.start_run(["a.pdf"])
+        os.rename(entries[0].source, entries[0].destination)
+        self.crash(history)
+
+        run = self.interrupted()
+        self.assertEqual(settle_pending(run), [(entries[0].source, entries[0].destination)])
+        rollback_run(run, HistoryJournal(self.history_dir))
+
+        self.assertEqual(read(entries[0].source), "a")
+        self.assertFalse(os.path.exists(entries[0].destination))
+        self.assertEqual(HistoryJournal(self.history_dir).interrupted_runs(), [])
+
+    def test_reserved_name_on_same_device_is_removed_on_resume(self):
+        write(os.path.join(self.directory, "a.pdf"), "a")
+        history, entries = self.start_run(["a.pdf"])
+        # The process died after reserving the name, before renaming over it
+        write(entries[0].destination, "")
+        self.crash(history)
+
+        run = self.interrupted()
+        self.assertEqual(settle_pending(run), [])
+        self.assertFalse(os.path.exists(entries[0].destination))
+        self.assertEqual(read(entries[0].source), "a")
+
+        summary = resume_run(run, HistoryJournal(self.history_dir))
+        self.assertEqual((summary.moved, summary.skipped), (1, 0))
+        self.assertEqual(read(entries[0].destination), "a")
+
+    def test_live_run_is_not_interrupted(self):
+        write(os.path.join(self.directory, "a.pdf"), "a")
+        history, _ = self.start_run(["a.pdf"])
+
+        self.assertEqual(HistoryJournal(self.history_dir).interrupted_runs(), [])
+        self.crash(history)
+        self.assertEqual(len(HistoryJournal(self.history_dir).interrupted_runs()), 1)
+
+    def test_cross_device_leftovers_are_removed(self):
+        source = os.path.join(self.directory, "a.pdf")
+        destination = os.path.join(self.documents, "a.pdf")
+        write(source, "a")
+        st = os.lstat(source)
+        # Pretend the source was on another device: the empty reserved name
+        # and the side file of the copy are this run's leftovers
+        identity = (st.st_dev + 1, st.st_ino, st.st_size, st.st_mtime_ns)
+        write(destination, "")
+        partial = partial_path(destination)
+        write(partial, "half")
+        run = InterruptedRun("run", self.directory, {}, st.st_mtime - 1, [],
+                             [(source, destination, identity)])
+
+        self.assertEqual(settle_pending(run), [])
+        self.assertFalse(os.path.exists(destination))
+        self.assertFalse(os.path.exists(partial))
+        self.assertEqual(read(source), "a")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+"""Compiled rule sets: the first matching rule wins, however the rules are grouped."""
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from organizer.rules import RuleSet
+
+
+class RuleSetTest(unittest.TestCase):
+    def test_first_matching_rule_wins_across_kinds(self):
+        rules = RuleSet([
+            {"regex": "report", "destination": "Reports"},
+            {"glob": "*.pdf", "destination": "Pdf"},
+            {"extensions": [".pdf"], "destination": "Never"},
+            {"glob": "invoice_*.pdf", "destination": "Invoices"},
+        ])
+        self.assertEqual(rules.match("report_1.pdf"), "Reports")
+        self.assertEqual(rules.match("invoice_1.pdf"), "Pdf")
+        self.assertEqual(rules.match("report.txt"), "Reports")
+        self.assertEqual(rules.match("notes.txt"), "Documents")
+        self.assertEqual(rules.match("blob.unknownext"), "Others")
+
+    def test_later_pattern_is_tried_when_earlier_conditions_fail(self):
+        rules = RuleSet([
+            {"regex": "IMG_", "extensions": [".png"], "destination": "Screens"},
+            {"regex": "IMG_\\d+", "destination": "Camera"},
+        ], include_defaults=False)
+        self.assertEqual(rules.match("IMG_1.png"), "Screens")
+        self.assertEqual(rules.match("IMG_1.jpg"), "Camera")
+        self.assertEqual(rules.match("IMG_x.jpg"), "Others")
+
+    def test_numbered_backreference(self):
+        rules = RuleSet([
+            {"regex": "IMG_", "destination": "Images"},
+            {"regex": r"(\w)\1", "destination": "Double"},
+            {"regex": "a", "destination": "A"},
+        ], include_defaults=False)
+        self.assertEqual(rules.match("aab.txt"), "Double")
+        self.assertEqual(rules.match("abc.txt"), "A")
+        self.assertEqual(rules.match("IMG_aa.jpg"), "Images")
+
+    def test_glob_extension_groups(self):
+        rules = RuleSet([
+            {"glob": "invoice_*.pdf", "destination": "Invoices"},
+            {"glob": "scan_*.PDF", "destination": "Scans"},
+            {"glob": "invoice_*.txt", "destination": "Notes"},
+            {"glob": "invoice_*", "destination": "Other invoices"},
+        ], include_defaults=False)
+        self.assertEqual(rules.match("Invoice_3.PDF"), "Invoices")
+        self.assertEqual(rules.match("scan_1.pdf"), "Scans")
+        self.assertEqual(rules.match("invoice_3.txt"), "Notes")
+        self.assertEqual(rules.match("invoice_3.doc"), "Other invoices")
+        self.assertEqual(rules.match("scan_1.txt"), "Others")
+
+    def test_inline_global_flags_are_combined(self):
+        with self.assertNoLogs("organizer.rules"):
+            rules = RuleSet([
+                {"regex": "(?i)readme", "destination": "Readme"},
+                {"regex": "IMG_", "destination": "Images"},
+            ], include_defaults=False)
+        self.assertIsNotNone(rules._generic.combined)
+        self.assertEqual(rules._generic._alone, set())
+        self.assertEqual(rules.match("README.md"), "Readme")
+        self.assertEqual(rules.match("IMG_1.jpg"), "Images")
+        self.assertEqual(rules.match("img_1.jpg"), "Others")
+
+
+class StatRulesTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def write(self, name, size):
+        path = os.path.join(self.root, name)
+        with open(path, "wb") as f:
+            f.write(b"x" * size)
+        return path
+
+    def test_size_rule_needs_the_file(self):
+        rules = RuleSet([
+            {"extensions": [".mp4"], "min_size": "1KB", "destination": "Videos/Large"},
+            {"glob": "*.mp4", "destination": "Videos/Small"},
+        ], include_defaults=False)
+        self.assertEqual(rules.match("big.mp4", self.write("big.mp4", 2048)), "Videos/Large")
+        self.assertEqual(rules.match("small.mp4", self.write("small.mp4", 10)), "Videos/Small")
+        # Without a path the size is unknown and the rule never matches
+        self.assertEqual(rules.match("big.mp4"), "Videos/Small")
+
+    def test_date_destination(self):
+        path = self.write("a.log", 1)
+        os.utime(path, (0, 1700000000))
+        rules = RuleSet([{"glob": "*.log", "destination": "Logs/{year}/{ext}"}],
+                        include_defaults=False)
+        year = time.localtime(1700000000).tm_year
+        self.assertEqual(rules.match("a.log", path), os.path.join("Logs", str(year), "log"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+"""Content sniffing: which signatures win, and when they may override an extension."""
+import os
+import shutil
+import tempfile
+import unittest
+
+from organizer.sniff import ContentSniffer, SniffCache, sniff_bytes
+
+
+def ftyp(brand):
+    return b"\x00\x00\x00\x18ftyp" + brand + b"\x00\x00\x00\x00"
+
+
+class SniffBytesTest(unittest.TestCase):
+    def test_heif_and_avif_are_images(self):
+        for brand in (b"heic", b"heix", b"mif1", b"msf1", b"avif"):
+            self.assertEqual(sniff_bytes(ftyp(brand)), "Images", brand)
+        self.assertEqual(sniff_bytes(ftyp(b"isom")), "Videos")
+        self.assertEqual(sniff_bytes(ftyp(b"qt  ")), "Videos")
+        self.assertEqual(sniff_bytes(ftyp(b"M4A ")), "Music")
+
+    def test_weak_signatures(self):
+        self.assertEqual(sniff_bytes(b"MZ is a zip code"), "Executables")
+        self.assertIsNone(sniff_bytes(b"MZ is a zip code", strong_only=True))
+        self.assertIsNone(sniff_bytes(b"ID3 tags", strong_only=True))
+        self.assertEqual(sniff_bytes(b"%PDF-1.7", strong_only=True), "Documents")
+
+
+class ContentSnifferTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.sniffer = ContentSniffer("all", workers=2,
+                                      cache=SniffCache(os.path.join(self.root, "cache.json")))
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def write(self, name, content):
+        with open(os.path.join(self.root, name), "wb") as f:
+            f.write(content)
+        return name
+
+    def classify(self, *names):
+        return dict(self.sniffer.classify(self.root, names))
+
+    def test_weak_signature_does_not_override_known_extension(self):
+        names = [self.write("notes.txt", b"MZ notes"),
+                 self.write("run.py", b"#!/usr/bin/env python\n"),
+                 self.write("blob", b"MZ\x90\x00"),
+                 self.write("photo.txt", b"\xff\xd8\xff\xe0")]
+        expected = {"notes.txt": "Documents", "run.py": "Code", "blob": "Executables",
+                    "photo.txt": "Images"}
+        self.assertEqual(self.classify(*names), expected)
+        # Cached results give the same answers
+        self.assertEqual(self.classify(*names), expected)
+
+    def test_heic_photo_is_an_image(self):
+        self.assertEqual(self.classify(self.write("IMG_0001.heic", ftyp(b"heic"))),
+                         {"IMG_0001.heic": "Images"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+"""Incremental runs: what a second run with the saved state picks up again."""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from organizer.engine import organize_directory
+from organizer.history import HistoryJournal
+from organizer.state import open_state
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+class IncrementalStateTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.directory = os.path.join(self.root, "incoming")
+        os.makedirs(self.directory)
+        self.history = HistoryJournal(os.path.join(self.root, "history"))
+        self.state_file = os.path.join(self.root, "state.sqlite3")
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def organize(self, **kwargs):
+        state = open_state(self.directory, path=self.state_file)
+        try:
+            return organize_directory(self.directory, history=self.history, state=state, **kwargs)
+        finally:
+            state.close()
+
+    def test_file_arriving_during_a_run_is_picked_up_next_time(self):
+        write(os.path.join(self.directory, "a.pdf"), "a")
+        late = os.path.join(self.directory, "late.pdf")
+
+        def progress(done, total):
+            if not os.path.exists(late):
+                write(late, "late")
+
+        self.assertEqual(self.organize(progress=progress).moved, 1)
+        self.assertTrue(os.path.exists(late))
+
+        self.assertEqual(self.organize().moved, 1)
+        self.assertFalse(os.path.exists(late))
+
+    def test_failed_move_is_retried(self):
+        write(os.path.join(self.directory, "a.pdf"), "a")
+        with mock.patch("organizer.executor.move_without_overwrite",
+                        side_effect=PermissionError(13, "Permission denied")):
+            self.assertEqual(self.organize().failed, 1)
+
+        self.assertEqual(self.organize().moved, 1)
+        self.assertTrue(os.path.exists(os.path.join(self.directory, "Sorted", "Documents", "a.pdf")))
+
+    def test_skipped_file_is_not_classified_again(self):
+        write(os.path.join(self.directory, "Sorted", "Documents", "a.pdf"), "sorted")
+        write(os.path.join(self.directory, "a.pdf"), "a")
+
+        self.assertEqual(self.organize().skipped, 1)
+        summary = self.organize()
+        self.assertEqual((summary.moved, summary.skipped), (0, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
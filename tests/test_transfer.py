@@ -0,0 +1,43 @@
+"""Moving files to another filesystem through a side file."""
+import os
+import shutil
+import tempfile
+import unittest
+
+from organizer.transfer import Transfer
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+class TransferTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_longest_name_can_be_copied(self):
+        name = "a" * 251 + ".pdf"
+        source = os.path.join(self.root, "in", name)
+        destination = os.path.join(self.root, "out", name)
+        write(source, "a")
+        os.makedirs(os.path.dirname(destination))
+        write(destination, "")
+
+        Transfer().move(source, destination)
+        self.assertEqual(read(destination), "a")
+        self.assertFalse(os.path.exists(source))
+        self.assertEqual(os.listdir(os.path.dirname(destination)), [name])
+
+
+if __name__ == "__main__":
+    unittest.main()